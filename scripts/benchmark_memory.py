@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# Compare the memory used by a loaded simulation cache
+# with plain dicts and with SimRecord entries.
+import os
+import sys
+import json
+import uuid
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+from smurf.cache import SimCache
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n",
+                        type=int,
+                        default=100000,
+                        help="Number of simulations in the cache.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache_file = os.path.join(tmpdir, "cache.json")
+        with open(cache_file, "w") as outfile:
+            json.dump(make_entries(args.n), outfile)
+
+        dicts = measure(lambda: load_json(cache_file))
+        records = measure(lambda: SimCache(cache_file).data)
+
+    print("{} simulations".format(args.n))
+    print("dicts:   {:8.1f} MB".format(dicts / 1e6))
+    print("records: {:8.1f} MB".format(records / 1e6))
+    print("reduction: {:.0f} %".format(100 * (1 - records / dicts)))
+
+
+def make_entries(n):
+    hosts = ["localhost"] + ["node{:02d}".format(k) for k in range(20)]
+    simcodes = ["fargo3d", "pluto", "athena++", "phantom"]
+    tags = ["", "production", "test, lowres", "paper1, highres, final"]
+    rv = {}
+    for k in range(n):
+        simid = str(uuid.uuid4())
+        name = "run{:06d}".format(k)
+        rv[simid] = {
+            "uuid": simid,
+            "name": name,
+            "path": "/scratch/user/project{}/{}".format(k % 50, name),
+            "host": random.choice(hosts),
+            "tags": random.choice(tags),
+            "simcode": random.choice(simcodes)
+        }
+    return rv
+
+
+def load_json(cache_file):
+    with open(cache_file, "r") as infile:
+        return json.load(infile)
+
+
+def measure(load):
+    """ Return the memory in bytes held by the object returned by load. """
+    tracemalloc.start()
+    data = load()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del data
+    return size
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ from .project import project_root
 from .project import project_name
 from .info import Info
 from .config import Config
+from .config import get_config
 
 
 def Mount(search_pattern, **kwargs):
@@ -11,4 +12,4 @@ def Mount(search_pattern, **kwargs):
     from .search import search, remote_path
     sim = search(search_pattern, remote=True, unique=True)[0]
     path = remote_path(sim)
-    return Mount(path)
+    return Mount(path, **kwargs)
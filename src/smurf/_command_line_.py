@@ -1,24 +1,54 @@
 # Caller for scripts in the smurf package
-import argparse
 import os
 import sys
-from subprocess import run
 
 this_files_dir = os.path.dirname(os.path.abspath(__file__))
 
+# subcommands and the files implementing them
+# listed here to not look through the package dir on every call
+scripts = {
+    "cache": "cache.py",
+    "config": "config.py",
+    "daemon": "daemon.py",
+    "enable_shell_plugin": "enable_shell_plugin.py",
+    "info": "info.py",
+    "init": "init.py",
+    "ls": "ls.py",
+    "mount": "mount.py",
+    "new_uuid": "new_uuid.py",
+    "project": "project.py",
+    "search": "search.py"
+}
+
 
 def main():
     args = parse_command_line_args()
     name = args.script
+    from smurf.daemon import run_in_daemon
+    code = run_in_daemon(name, args.args)
+    if code is not None:
+        sys.exit(code)
     if script_file_name(name)[-3:] == ".py":
         import importlib
         script_module = importlib.import_module("." + name, package="smurf")
         sys.argv = [os.path.join(this_files_dir, name + ".py")] + args.args
         script_module.main()
     else:
+        from subprocess import run
         run([script_path(name)] + args.args)
 
 
+def autocomplete(parser):
+    """ Run argcomplete on the parser if called for shell completion.
+
+    argcomplete is only imported when needed because importing it
+    takes a noticeable part of the startup time.
+    """
+    if "_ARGCOMPLETE" in os.environ:
+        import argcomplete
+        argcomplete.autocomplete(parser)
+
+
 def get_ssh_original_command_args():
     try:
         if sys.argv[1] == "--use-ssh-original-command":
@@ -43,6 +73,7 @@ def parse_command_line_args():
     else:
         argv = sys.argv[1:]
 
+    import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("script",
                         choices=available_scripts(),
@@ -53,6 +84,14 @@ def parse_command_line_args():
 
 
 def available_scripts(filenames=False):
+    if filenames:
+        return sorted(scripts.values())
+    else:
+        return sorted(scripts)
+
+
+def find_scripts(filenames=False):
+    """ Look through the package dir for subcommands. """
     files = os.listdir(this_files_dir)
     python_scripts = [f for f in files if f[-3:] == ".py" and not f[0] == "_"]
     bash_scripts = [f for f in files if f[-3:] == ".sh"]
@@ -74,7 +113,9 @@ def available_scripts(filenames=False):
 
 
 def filter_backend_scripts(unfiltered):
-    to_filter = ["doublefork"]
+    to_filter = [
+        "doublefork", "scan", "bincache", "ssh", "mount_manager", "datacache"
+    ]
     rv = []
     for s in unfiltered:
         if all([x not in s for x in to_filter]):
@@ -83,17 +124,11 @@ def filter_backend_scripts(unfiltered):
 
 
 def script_file_name(name):
-    files = os.listdir(this_files_dir)
-    for f in files:
-        if f.startswith(name):
-            bash_name = f[:-3] + ".sh"
-            python_name = f[:-3] + ".py"
-            if python_name in files:
-                return python_name
-            else:
-                return bash_name
-    raise FileNotFoundError(
-        "Could not find script file for script '{}'".format(name))
+    try:
+        return scripts[name]
+    except KeyError:
+        raise FileNotFoundError(
+            "Could not find script file for script '{}'".format(name))
 
 
 def script_path(name):
@@ -0,0 +1,309 @@
+""" Compact binary file format for simulation caches.
+
+The entries are stored column by column and sorted by uuid:
+
+- a header with the magic bytes, the format version, the number of entries,
+  the number of interned strings and the offsets of all sections
+- the uuids as 36 ascii characters each
+- one byte per entry with flags telling which columns are set
+- the indices of host and simcode into a table of interned strings
+- offsets and utf-8 data of the name, path and tags columns
+  and of a json column holding all other fields
+- offsets and utf-8 data of the interned strings
+
+Single entries can be looked up in a memory mapped file
+without decoding the whole cache.
+"""
+import os
+import re
+import json
+import mmap
+import bisect
+import struct
+
+magic = b"SMURFBIN"
+version = 1
+# length of a uuid in its canonical form
+uuid_length = 36
+
+# columns stored as separate strings per entry
+string_columns = ["name", "path", "tags"]
+# columns with few distinct values which are stored in a table of strings
+interned_columns = ["host", "simcode"]
+# flag for the uuid field being equal to the key
+uuid_flag = 1 << (len(string_columns) + len(interned_columns))
+# fields of an entry written by smurf, in the order of the flag bits
+complete_fields = string_columns + interned_columns + ["uuid"]
+complete_flags = (uuid_flag << 1) - 1
+canonical_uuid = re.compile(
+    "[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+# sections: uuids, flags, the interned columns, offsets and data of the
+# string columns and the extra column, offsets and data of the string table
+n_sections = 2 + len(interned_columns) + 2 * len(string_columns) + 2 + 2
+header = struct.Struct("<8sIII{}Q".format(n_sections))
+
+
+def dumps(data):
+    """ Encode a dict of cache entries.
+
+    Parameters
+    ----------
+    data : dict
+        Cache entries keyed by uuid.
+
+    Returns
+    -------
+    bytes
+    """
+    keys = sorted(data)
+    for key in keys:
+        if canonical_uuid.fullmatch(key) is None:
+            raise ValueError("'{}' is not a valid uuid".format(key))
+    strings = {}
+    flags = bytearray()
+    names, paths, tags, extras, hosts, simcodes = [], [], [], [], [], []
+    for key in keys:
+        value = data[key]
+        try:
+            # the common case of an entry with all columns set and nothing else
+            if len(value) == len(complete_fields) and value["uuid"] == key:
+                row = (value["name"], value["path"], value["tags"],
+                       value["host"], value["simcode"])
+                if all(isinstance(s, str) for s in row):
+                    names.append(row[0])
+                    paths.append(row[1])
+                    tags.append(row[2])
+                    hosts.append(strings.setdefault(row[3], len(strings)))
+                    simcodes.append(strings.setdefault(row[4], len(strings)))
+                    extras.append("")
+                    flags.append(complete_flags)
+                    continue
+        except KeyError:
+            pass
+        flag = 0
+        extra = {}
+        for n, name in enumerate(complete_fields):
+            if name not in value:
+                continue
+            s = value[name]
+            if name == "uuid":
+                if s == key:
+                    flag |= uuid_flag
+                else:
+                    extra[name] = s
+            elif isinstance(s, str):
+                flag |= 1 << n
+            else:
+                extra[name] = s
+        row = [
+            value[name] if flag & (1 << n) else ""
+            for n, name in enumerate(complete_fields[:-1])
+        ]
+        names.append(row[0])
+        paths.append(row[1])
+        tags.append(row[2])
+        hosts.append(strings.setdefault(row[3], len(strings)))
+        simcodes.append(strings.setdefault(row[4], len(strings)))
+        for name in value:
+            if name not in complete_fields:
+                extra[name] = value[name]
+        extras.append(json.dumps(extra) if len(extra) > 0 else "")
+        flags.append(flag)
+    sections = ["".join(keys).encode(), bytes(flags)]
+    sections += [pack_ints(hosts), pack_ints(simcodes)]
+    for column in [names, paths, tags, extras, list(strings)]:
+        sections += pack_strings(column)
+    offsets = []
+    pos = header.size
+    for s in sections:
+        offsets.append(pos)
+        pos += len(s)
+    return header.pack(magic, version, len(keys), len(strings),
+                       *offsets) + b"".join(sections)
+
+
+def pack_ints(values):
+    return struct.pack("<{}I".format(len(values)), *values)
+
+
+def pack_strings(values):
+    """ Return the offsets and the data section of a string column. """
+    encoded = [s.encode() for s in values]
+    offsets = [0]
+    for e in encoded:
+        offsets.append(offsets[-1] + len(e))
+    return [pack_ints(offsets), b"".join(encoded)]
+
+
+class BinaryTable:
+    """ Read only view of a cache file in the binary format.
+
+    The file is memory mapped, only the entries which are accessed get decoded.
+    """
+
+    def __init__(self, infile):
+        """
+        Parameters
+        ----------
+        infile : file
+            File opened in binary mode.
+        """
+        size = os.fstat(infile.fileno()).st_size
+        if size < header.size:
+            raise ValueError("Not a binary cache file")
+        self.buf = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        fields = header.unpack_from(self.buf)
+        if fields[0] != magic:
+            raise ValueError("Not a binary cache file")
+        if fields[1] != version:
+            raise ValueError("Unsupported binary cache version {}".format(
+                fields[1]))
+        self.n, self.n_strings = fields[2:4]
+        self.sections = fields[4:]
+        self.uuids = UuidColumn(self.buf, self.sections[0], self.n)
+        self._strings = None
+
+    def __len__(self):
+        return self.n
+
+    def close(self):
+        self.buf.close()
+
+    def find(self, key):
+        """ Return the position of the entry with uuid key or None. """
+        b = key.encode()
+        n = bisect.bisect_left(self.uuids, b)
+        if n < self.n and self.uuids[n] == b:
+            return n
+        return None
+
+    def get(self, key):
+        """ Decode the entry with uuid key or return None if there is none. """
+        n = self.find(key)
+        if n is None:
+            return None
+        return self.entry(n)
+
+    def prefix(self, prefix):
+        """ Return the uuids starting with prefix. """
+        b = prefix.encode()
+        n = bisect.bisect_left(self.uuids, b)
+        rv = []
+        while n < self.n and self.uuids[n].startswith(b):
+            rv.append(self.uuids[n].decode())
+            n += 1
+        return rv
+
+    def entry(self, n):
+        """ Decode the n-th entry. """
+        flag = self.buf[self.sections[1] + n]
+        key = self.uuids[n].decode()
+        values = {}
+        for k, name in enumerate(string_columns):
+            if flag & (1 << k):
+                values[name] = self.string(2 + len(interned_columns) + 2 * k,
+                                           n)
+        for k, name in enumerate(interned_columns):
+            if flag & (1 << (len(string_columns) + k)):
+                index = struct.unpack_from("<I", self.buf,
+                                           self.sections[2 + k] + 4 * n)[0]
+                values[name] = self.strings[index]
+        extra = self.string(2 + len(interned_columns) + 2 * len(string_columns),
+                            n)
+        return assemble(key, flag, values,
+                        json.loads(extra) if extra != "" else {})
+
+    def string(self, section, n):
+        """ Decode the n-th string of the column starting at section. """
+        start, end = struct.unpack_from("<II", self.buf,
+                                        self.sections[section] + 4 * n)
+        data = self.sections[section + 1]
+        return self.buf[data + start:data + end].decode()
+
+    @property
+    def strings(self):
+        """ The table of interned strings. """
+        if self._strings is None:
+            self._strings = self.column(n_sections - 2, self.n_strings)
+        return self._strings
+
+    def column(self, section, count):
+        """ Decode all strings of the column starting at section. """
+        offsets = struct.unpack_from("<{}I".format(count + 1), self.buf,
+                                     self.sections[section])
+        start = self.sections[section + 1]
+        data = self.buf[start:start + offsets[-1]]
+        text = data.decode()
+        if len(text) == len(data):
+            # ascii only, byte offsets are character offsets
+            return [text[a:b] for a, b in zip(offsets, offsets[1:])]
+        return [data[a:b].decode() for a, b in zip(offsets, offsets[1:])]
+
+    def to_dict(self):
+        """ Decode all entries. """
+        n = self.n
+        start = self.sections[0]
+        text = self.buf[start:start + uuid_length * n].decode()
+        keys = [text[i:i + uuid_length] for i in range(0, len(text), uuid_length)]
+        flags = self.buf[self.sections[1]:self.sections[1] + n]
+        strings = self.strings
+        hosts, simcodes = [[
+            strings[k] for k in struct.unpack_from("<{}I".format(n), self.buf,
+                                                   self.sections[2 + c])
+        ] for c in range(len(interned_columns))]
+        names, paths, tags, extras = [
+            self.column(2 + len(interned_columns) + 2 * c, n)
+            for c in range(len(string_columns) + 1)
+        ]
+        rv = {}
+        for key, flag, name, path, host, tag, simcode, extra in zip(
+                keys, flags, names, paths, hosts, tags, simcodes, extras):
+            if flag == complete_flags and extra == "":
+                rv[key] = {
+                    "uuid": key,
+                    "name": name,
+                    "path": path,
+                    "host": host,
+                    "tags": tag,
+                    "simcode": simcode
+                }
+                continue
+            values = dict(
+                zip(string_columns + interned_columns,
+                    [name, path, tag, host, simcode]))
+            values = {
+                k: v
+                for n, (k, v) in enumerate(values.items()) if flag & (1 << n)
+            }
+            rv[key] = assemble(key, flag, values,
+                               json.loads(extra) if extra != "" else {})
+        return rv
+
+
+def assemble(key, flag, values, extra):
+    """ Put the fields of an entry together in the order used by the cache. """
+    rv = {}
+    if flag & uuid_flag:
+        rv["uuid"] = key
+    for name in ["name", "path", "host", "tags", "simcode"]:
+        if name in values:
+            rv[name] = values[name]
+    rv.update(extra)
+    return rv
+
+
+class UuidColumn:
+    """ Sequence of the uuids in a memory mapped file to be used with bisect. """
+
+    def __init__(self, buf, start, n):
+        self.buf = buf
+        self.start = start
+        self.n = n
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, n):
+        pos = self.start + uuid_length * n
+        return self.buf[pos:pos + uuid_length]
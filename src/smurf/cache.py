@@ -5,8 +5,11 @@ import json
 import re
 import smurf
 import smurf.info as siminfo
-import uuid
-import time
+from smurf.config import file_signature
+from smurf.scan import ScanState, find_simdirs_parallel
+import bisect
+from contextlib import contextmanager
+from collections.abc import Mapping
 
 
 class NoSimulationFoundError(Exception):
@@ -25,34 +28,48 @@ def main():
     if args.notify is not None:
         if len(args.notify) == 0:
             args.notify.append(os.getcwd())
-        for d in args.notify:
-            try:
-                c.add_sim_to_cache(expand_path(d))
-            except FileNotFoundError as e:
-                print(e)
+        with c.deferred_save():
+            for d in args.notify:
+                try:
+                    c.add_sim_to_cache(expand_path(d))
+                except FileNotFoundError as e:
+                    print(e)
         sys.exit(0)
 
     if args.scrub:
         c.scrub()
         sys.exit(0)
 
+    if args.convert is not None:
+        for cls in [LocalSimCache, RemoteSimCache]:
+            n = convert_cache(cls, args.convert)
+            print("Converted {} entries of the {} cache".format(
+                n, "local" if cls is LocalSimCache else "remote"))
+        conf = smurf.get_config()
+        conf["cache_engine"] = args.convert
+        conf.save()
+        sys.exit(0)
+
     if args.remove:
-        try:
-            c.remove(args.remove)
-        except KeyError:
-            pass
-        try:
-            RemoteSimCache().remove(args.remove)
-        except KeyError:
-            pass
+        for rc in [c, RemoteSimCache()]:
+            try:
+                rc.remove(args.remove)
+            except KeyError:
+                pass
+            except ResultNotUniqueError as e:
+                print(e, file=sys.stderr)
+                sys.exit(1)
         return
 
     if args.generate:
-        c.rebuild()
+        c.rebuild(incremental=args.incremental,
+                  nested=True if args.nested else None,
+                  jobs=args.jobs)
 
     if args.list:
         crem = RemoteSimCache()
-        data = [x for x in c.data.values()] + [x for x in crem.data.values()]
+        data = [dict(x) for x in c.data.values()
+                ] + [dict(x) for x in crem.data.values()]
         if args.json:
             print(json.dumps(data, indent=4))
         else:
@@ -65,7 +82,7 @@ sim_attributes = ["uuid", "name", "tags", "simcode", "path", "host", "location"]
 
 def parse_command_line_args():
     import argparse
-    import argcomplete
+    from smurf._command_line_ import autocomplete
     parser = argparse.ArgumentParser()
     parser.add_argument("--json",
                         default=False,
@@ -76,6 +93,19 @@ def parse_command_line_args():
                         default=False,
                         action="store_true",
                         help="Force (re)generation of the cache.")
+    parser.add_argument("--incremental",
+                        default=False,
+                        action="store_true",
+                        help="Only rescan directories which changed since the last generation.")
+    parser.add_argument("--nested",
+                        default=False,
+                        action="store_true",
+                        help="Also search for simdirs inside of simdirs.")
+    parser.add_argument("-j",
+                        "--jobs",
+                        type=int,
+                        default=1,
+                        help="Number of parallel threads used to generate the cache.")
     parser.add_argument("-s",
                         "--scrub",
                         default=False,
@@ -85,6 +115,9 @@ def parse_command_line_args():
                         "--notify",
                         nargs="*",
                         help="Notify the cache about a simulation.")
+    parser.add_argument("--convert",
+                        choices=["json", "binary", "sqlite"],
+                        help="Convert the caches to another engine and use it from now on.")
     parser.add_argument("-l",
                         "--list",
                         default=False,
@@ -93,7 +126,7 @@ def parse_command_line_args():
     parser.add_argument("-r",
                         "--remove",
                         help="Remove simulation with given id from cache.")
-    argcomplete.autocomplete(parser)
+    autocomplete(parser)
     args = parser.parse_args()
     return args
 
@@ -159,24 +192,117 @@ class Cache:
         return rv
 
 
+# minimum length of a uuid or name prefix to identify a simulation
+min_prefix_length = 4
+
+
+class PrefixIndex:
+    """ Sorted list of (string, key) pairs for prefix lookups using bisect. """
+
+    def __init__(self, pairs=()):
+        self.entries = sorted(pairs)
+
+    def add(self, string, key):
+        bisect.insort(self.entries, (string, key))
+
+    def remove(self, string, key):
+        n = bisect.bisect_left(self.entries, (string, key))
+        if n < len(self.entries) and self.entries[n] == (string, key):
+            del self.entries[n]
+
+    def iter_prefix(self, prefix):
+        """ Iterate over all (string, key) pairs with string starting with prefix. """
+        n = bisect.bisect_left(self.entries, (prefix, ))
+        while n < len(self.entries) and self.entries[n][0].startswith(prefix):
+            yield self.entries[n]
+            n += 1
+
+    def resolve(self, prefix):
+        """ Get the key of the only string starting with prefix.
+
+        A string equal to the prefix takes precedence over longer ones.
+        Only the matching range of the index is looked at.
+
+        Raises
+        ------
+        KeyError
+            If no string starts with prefix.
+        ResultNotUniqueError
+            If the prefix is ambiguous.
+        """
+        exact = set()
+        keys = set()
+        for string, key in self.iter_prefix(prefix):
+            if string == prefix:
+                exact.add(key)
+                continue
+            if len(exact) > 0:
+                break
+            keys.add(key)
+            if len(keys) > 1:
+                break
+        candidates = exact if len(exact) > 0 else keys
+        if len(candidates) == 0:
+            raise KeyError(prefix)
+        if len(candidates) > 1:
+            raise ResultNotUniqueError(
+                "'{}' is ambiguous! It matches more than one entry.".format(
+                    prefix))
+        return candidates.pop()
+
+    def exact(self, string):
+        """ Return the keys of all entries equal to string. """
+        n = bisect.bisect_left(self.entries, (string, ))
+        rv = []
+        while n < len(self.entries) and self.entries[n][0] == string:
+            rv.append(self.entries[n][1])
+            n += 1
+        return rv
+
+    def complete(self, prefix):
+        """ Return all strings starting with prefix. """
+        return [string for string, _ in self.iter_prefix(prefix)]
+
+
+def unique_key(keys, req):
+    """ Return the only element of keys or raise an error if there is none or more. """
+    if len(keys) == 0:
+        raise CacheMiss("Nothing found for", req)
+    if len(keys) > 1:
+        raise ResultNotUniqueError(
+            "'{}' is ambiguous! It matches more than one entry.".format(req))
+    return keys[0]
+
+
 class DoubleUuidCache(Cache):
-    """ Extension of Cache which uses two sets of keys, uuids and the first part of uuids. """
+    """ Extension of Cache which uses two sets of keys, uuids and the first part of uuids.
+
+    Any unambiguous uuid prefix of at least min_prefix_length characters
+    can be used instead of the full uuid.
+    """
 
     def __init__(self):
-        self.key_map = {}
+        self._uuid_index = None
+
+    @property
+    def uuid_index(self):
+        """ Prefix index of the uuids, built on first use. """
+        if self._uuid_index is None:
+            self._uuid_index = PrefixIndex((key, key) for key in self.data)
+        return self._uuid_index
 
     def map_key(self, key):
-        """ Get full uuid from key map if its a shortened id. """
+        """ Get full uuid if its a shortened id. """
+        if key in self.data or len(key) < min_prefix_length:
+            return key
         try:
-            rv = self.key_map[key]
+            return self.uuid_index.resolve(key)
         except KeyError:
-            rv = key
-        return rv
+            return key
 
     def create_map(self):
-        """ Create the map with shortened uuids. """
-        for key in self.data:
-            self.key_map[key.split("-")[0]] = key
+        """ Reset the index of shortened uuids. """
+        self._uuid_index = None
 
     def request(self, req):
         """ Wrap around parent's request. """
@@ -185,80 +311,589 @@ class DoubleUuidCache(Cache):
 
     def insert(self, key, value):
         """ Insert value with full uuid and register shortened uuid """
-        if not self.is_uuid(key):
-            raise ValueError("'{}' is not a valid uuid".format(key))
-        short = key.split("-")[0]
-        self.key_map[short] = key
+        key = self.canonical_key(key)
+        if self._uuid_index is not None and key not in self.data:
+            self._uuid_index.add(key, key)
         super().insert(key, value)
 
     def remove(self, key):
         """ Remove the value belonging to key from the dict """
         key = self.map_key(key)
-        short = key.split("-")[0]
+        if self._uuid_index is not None and key in self.data:
+            self._uuid_index.remove(key, key)
         super().remove(key)
-        try:
-            del self.key_map[short]
-        except KeyError:
-            pass
 
     def is_uuid(self, key):
         """ Check whether a key is a valid uuid. """
         try:
-            uuid.UUID(key)
+            self.canonical_key(key)
         except ValueError:
             return False
         return True
 
+    def canonical_key(self, key):
+        """ Return the canonical form of a uuid, e.g. for a uuid without dashes.
+
+        Raises
+        ------
+        ValueError
+            If key is not a valid uuid.
+        """
+        import uuid
+        try:
+            return str(uuid.UUID(key))
+        except (ValueError, TypeError, AttributeError):
+            raise ValueError("'{}' is not a valid uuid".format(key))
+
     def contains(self, key):
         """ Return True if the cache contains key, false otherwise. """
-        rv = key in self.data or key in self.key_map
-        return rv
+        try:
+            return self.map_key(key) in self.data
+        except ResultNotUniqueError:
+            return False
 
 
 class JsonCache(DoubleUuidCache):
-    """ Implementation of a simple cache with the ability to store data in a json file """
+    """ Implementation of a simple cache with the ability to store data in a json file
+
+    If a journal size is given, changes are appended to a journal file
+    next to the cache file instead of rewriting the whole cache.
+    The journal is applied on top of the cache file when loading
+    and merged into the cache file once it grows past the journal size.
+    The cache file is only read when the data is first accessed,
+    so inserting items does not depend on the size of the cache.
+    """
 
-    def __init__(self, cache_file):
+    # replaces the extension of the cache file if set
+    file_extension = None
+
+    def __init__(self, cache_file, flush_threshold=None, journal_size=None):
         super().__init__()
+        if self.file_extension is not None:
+            cache_file = os.path.splitext(cache_file)[0] + self.file_extension
         self.cache_file = cache_file
+        self.journal_file = cache_file + ".journal"
+        # size in bytes up to which changes are appended to the journal
+        self.journal_size = journal_size
+        # number of changes after which a deferred save is flushed early
+        self.flush_threshold = flush_threshold
+        self.batch_depth = 0
+        self.pending_changes = 0
+        # changes since the last save, removed keys map to the removed marker
+        self.changes = {}
         self.load()
-        super().create_map()
+        self.create_map()
+
+    @property
+    def data(self):
+        """ Content of the cache, read from file on first access. """
+        if self._data is None:
+            self.signature = self.file_signatures()
+            data = self.read_data()
+            apply_changes(data, self.changes)
+            self._data = data
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
 
     def save(self):
-        """ Save the cache to file. """
-        with open(self.cache_file, "w") as outfile:
-            outfile.write(json.dumps(self.data))
+        """ Save the cache to file.
+
+        The file is locked while saving. If another process changed it
+        since it was loaded, the changes made here are applied on top of
+        the content on disk. The new content is written to a temporary file
+        which replaces the cache file, so readers never see partial files.
+        """
+        with locked(self.cache_file):
+            stale = self.is_stale()
+            if self.journal_size is not None and self.append_journal():
+                if not stale and self._data is not None:
+                    self.signature = self.file_signatures()
+            else:
+                if stale:
+                    data = self.read_data()
+                    apply_changes(data, self.changes)
+                    self.data = data
+                    self.create_map()
+                self.write_file(self.data)
+                try:
+                    os.remove(self.journal_file)
+                except FileNotFoundError:
+                    pass
+                self.signature = self.file_signatures()
+        self.changes = {}
+        self.pending_changes = 0
+
+    def append_journal(self):
+        """ Append the changes since the last save to the journal.
+
+        Returns
+        -------
+        bool
+            False if the journal would grow past the journal size
+            and the cache file needs to be rewritten instead.
+        """
+        records = [{
+            "key": key
+        } if value is removed else {
+            "key": key,
+            "value": value
+        } for key, value in self.changes.items()]
+        lines = "".join(json.dumps(r, default=dict) + "\n" for r in records)
+        base = file_signature(self.cache_file)
+        header = json.dumps({"base": base}) + "\n"
+        try:
+            with open(self.journal_file, "r") as infile:
+                valid = infile.readline() == header
+                size = infile.seek(0, os.SEEK_END)
+        except FileNotFoundError:
+            valid = False
+        if not valid:
+            lines = header + lines
+            size = 0
+        if size + len(lines) > self.journal_size:
+            return False
+        with open(self.journal_file, "a" if valid else "w") as outfile:
+            if valid and not self.journal_ends_with_newline():
+                # a previous writer crashed in the middle of a record
+                outfile.write("\n")
+            outfile.write(lines)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        return True
+
+    def journal_ends_with_newline(self):
+        with open(self.journal_file, "rb") as infile:
+            infile.seek(-1, os.SEEK_END)
+            return infile.read(1) == b"\n"
+
+    def read_journal(self, base):
+        """ Read the changes recorded in the journal.
+
+        Parameters
+        ----------
+        base : tuple
+            Signature of the cache file the journal has to belong to.
+            A journal left over from an older cache file is ignored.
+
+        Returns
+        -------
+        dict
+            Changed keys mapped to their new values or the removed marker.
+        """
+        try:
+            with open(self.journal_file, "r") as infile:
+                lines = infile.read().split("\n")
+        except FileNotFoundError:
+            return {}
+        if lines[0] != json.dumps({"base": base}):
+            return {}
+        changes = {}
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except json.decoder.JSONDecodeError:
+                # empty line or record which is still being written
+                continue
+            changes[record["key"]] = record.get("value", removed)
+        return changes
+
+    def file_signatures(self):
+        """ Signatures of the cache file and the journal. """
+        return (file_signature(self.cache_file),
+                file_signature(self.journal_file))
+
+    def is_stale(self):
+        """ Check whether the cache file changed since it was loaded or saved. """
+        return (self._data is not None
+                and self.file_signatures() != self.signature)
+
+    def reload(self):
+        """ Load the cache file again and reset the indices. """
+        self.load()
+        self.create_map()
 
     def load(self):
-        """ Load the cache from file or create an empty one. """
-        self.recursion_depth = 0
+        """ Discard the loaded content, the file is read again on first access. """
+        self._data = None
+        self.changes = {}
+
+    def read_data(self):
+        """ Read the cache file and apply the journal on top of it. """
+        data, base = self.read_file()
+        apply_changes(data, self.read_journal(base))
+        return data
+
+    def read_file(self):
+        """ Read the content of the cache file.
+
+        Returns
+        -------
+        (dict, tuple)
+            Content and signature of the file that was read.
+        """
         try:
             with open(self.cache_file, "r") as infile:
-                self.data = json.load(infile)
+                st = os.fstat(infile.fileno())
+                signature = [st.st_mtime_ns, st.st_size, st.st_ino]
+                try:
+                    return json.load(infile), signature
+                except json.decoder.JSONDecodeError:
+                    return {}, signature
         except FileNotFoundError:
-            self.data = {}
-        except json.decoder.JSONDecodeError:
-            if self.recursion_depth < 4:
-                self.recursion_depth += 1
-                time.sleep(0.1)
-                self.load()
+            return {}, None
+
+    def write_file(self, data):
+        """ Atomically replace the cache file with new content. """
+        with atomic_write(self.cache_file) as outfile:
+            outfile.write(json.dumps(data, default=dict))
+
+    @contextmanager
+    def deferred_save(self, flush_threshold=None):
+        """ Apply changes in memory and save the cache once at the end.
+
+        Nested calls are allowed, only the outermost one saves.
+
+        Parameters
+        ----------
+        flush_threshold: int
+            Save early after this many changes to limit the loss in case of a crash.
+            Defaults to the threshold given to the constructor.
+        """
+        previous_threshold = self.flush_threshold
+        if flush_threshold is not None and self.batch_depth == 0:
+            self.flush_threshold = flush_threshold
+        self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.batch_depth -= 1
+            if self.batch_depth == 0:
+                self.flush_threshold = previous_threshold
+                if self.pending_changes > 0:
+                    self.save()
+
+    def changed(self):
+        """ Save the cache or defer saving if inside a deferred_save block. """
+        if self.batch_depth == 0:
+            self.save()
+            return
+        self.pending_changes += 1
+        if self.flush_threshold is not None and self.pending_changes >= self.flush_threshold:
+            self.save()
 
     def insert(self, key, value):
-        """ Insert an element and save the cache to file. """
-        super().insert(key, value)
-        self.save()
+        """ Insert an element and save the cache to file.
+
+        If the cache file was not read yet, the element is only recorded
+        as a change and the file is not read.
+        """
+        key = self.canonical_key(key)
+        if self._data is not None:
+            super().insert(key, value)
+        self.changes[key] = value
+        self.changed()
 
     def remove(self, key):
         """ Remove the element from the cache and save the cache to file. """
+        key = self.map_key(key)
         super().remove(key)
-        self.save()
+        self.changes[key] = removed
+        self.changed()
+
+
+# marker for removed keys in JsonCache.changes
+removed = object()
+
+
+def apply_changes(data, changes):
+    """ Apply changes recorded by JsonCache to a dict. """
+    for key, value in changes.items():
+        if value is removed:
+            data.pop(key, None)
+        else:
+            data[key] = value
+
+
+@contextmanager
+def locked(path):
+    """ Hold an exclusive advisory lock on a lock file next to path. """
+    import fcntl
+    with open(path + ".lock", "a") as lockfile:
+        fcntl.flock(lockfile, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+
+@contextmanager
+def atomic_write(path, mode="w"):
+    """ Write to a temporary file which replaces path when done. """
+    import tempfile
+    dirname, basename = os.path.split(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=dirname, prefix=basename + ".")
+    try:
+        with os.fdopen(fd, mode) as outfile:
+            yield outfile
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+# fields of a simulation entry stored in the slots of SimRecord
+record_fields = ("uuid", "name", "path", "host", "tags", "simcode")
+# fields whose values repeat between simulations and are interned
+interned_fields = ("host", "tags", "simcode")
+
+
+class SimRecord(Mapping):
+    """ Compact and read only cache entry of a simulation.
+
+    The fields written by smurf are stored in slots
+    and the strings which repeat between simulations are interned.
+    Any other fields are kept in a dict.
+    Reading works like for a dict, dict(record) gives a modifiable copy.
+    """
+    __slots__ = record_fields + ("_extra", )
+
+    def __init__(self, value, key=None):
+        """
+        Parameters
+        ----------
+        value : dict
+            The entry.
+        key : str
+            Uuid the entry is stored under. Its string is reused for the uuid field.
+        """
+        if len(value) == len(record_fields):
+            # the common case of an entry written by smurf
+            try:
+                uuid = value["uuid"]
+                self.uuid = key if uuid == key else uuid
+                self.name = value["name"]
+                self.path = value["path"]
+                self.host = sys.intern(value["host"])
+                self.tags = sys.intern(value["tags"])
+                self.simcode = sys.intern(value["simcode"])
+                self._extra = None
+                return
+            except (KeyError, TypeError):
+                pass
+        extra = None
+        for name, v in value.items():
+            if name not in record_fields:
+                if extra is None:
+                    extra = {}
+                extra[name] = v
+                continue
+            if name == "uuid" and v == key:
+                v = key
+            elif name in interned_fields and type(v) is str:
+                v = sys.intern(v)
+            setattr(self, name, v)
+        self._extra = extra
+
+    def __getitem__(self, name):
+        if name in record_fields:
+            try:
+                return getattr(self, name)
+            except AttributeError:
+                raise KeyError(name) from None
+        if self._extra is None:
+            raise KeyError(name)
+        return self._extra[name]
+
+    def get(self, name, default=None):
+        if name in record_fields:
+            return getattr(self, name, default)
+        if self._extra is None:
+            return default
+        return self._extra.get(name, default)
+
+    def __contains__(self, name):
+        if name in record_fields:
+            return hasattr(self, name)
+        return self._extra is not None and name in self._extra
+
+    def __iter__(self):
+        for name in record_fields:
+            if hasattr(self, name):
+                yield name
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        n = sum(1 for name in record_fields if hasattr(self, name))
+        return n if self._extra is None else n + len(self._extra)
+
+    def __repr__(self):
+        return "SimRecord({!r})".format(dict(self))
+
+
+@contextmanager
+def gc_paused():
+    """ Pause the cyclic garbage collector while loading many entries.
+
+    Cache entries can not form reference cycles, but the collections
+    triggered by allocating them would traverse all entries again and again.
+    """
+    import gc
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
 
 
 class SimCache(JsonCache):
-    """ A cache for simulations """
+    """ A cache for simulations
 
-    def __init__(self, cache_file):
-        super().__init__(cache_file)
+    If compact is set, entries are kept in memory as SimRecord objects.
+    """
+    # whether the entries are loaded into memory, e.g. by the daemon
+    in_memory = True
+    # keep the entries as SimRecord objects, which takes longer to load
+    # but pays off in long running processes like the daemon
+    compact = False
+
+    def __init__(self, cache_file, flush_threshold=None, journal_size=None):
+        self._name_index = None
+        self._search_indices = {}
+        super().__init__(cache_file,
+                         flush_threshold=flush_threshold,
+                         journal_size=journal_size)
+
+    @property
+    def name_index(self):
+        """ Prefix index of the simulation names, built on first use. """
+        if self._name_index is None:
+            self._name_index = PrefixIndex((sim["name"], key)
+                                           for key, sim in self.data.items()
+                                           if "name" in sim)
+        return self._name_index
+
+    def create_map(self):
+        """ Reset the indices of uuids, names and the search indices. """
+        super().create_map()
+        self._name_index = None
+        self._search_indices = {}
+
+    def read_data(self):
+        """ Read the cache file and convert the entries to records if compact is set. """
+        if not self.compact:
+            return super().read_data()
+        with gc_paused():
+            return {
+                key: SimRecord(value, key)
+                for key, value in super().read_data().items()
+            }
+
+    def insert(self, key, value):
+        """ Insert a simulation and update the name index. """
+        key = self.canonical_key(key)
+        if self.compact and not isinstance(value, SimRecord):
+            value = SimRecord(value, key)
+        self._search_indices = {}
+        if self._name_index is not None:
+            if key in self.data and "name" in self.data[key]:
+                self._name_index.remove(self.data[key]["name"], key)
+            if "name" in value:
+                self._name_index.add(value["name"], key)
+        super().insert(key, value)
+
+    def remove(self, key):
+        """ Remove a simulation and update the name index. """
+        key = self.map_key(key)
+        self._search_indices = {}
+        if self._name_index is not None and key in self.data:
+            if "name" in self.data[key]:
+                self._name_index.remove(self.data[key]["name"], key)
+        super().remove(key)
+
+    def resolve(self, prefix):
+        """ Get the uuid of the simulation identified by a uuid or name prefix.
+
+        Parameters
+        ----------
+        prefix : str
+            Prefix of the uuid or name of at least min_prefix_length characters
+            or a full name.
+
+        Returns
+        -------
+        str
+            The uuid.
+
+        Raises
+        ------
+        CacheMiss
+            If no simulation matches.
+        ResultNotUniqueError
+            If the prefix matches more than one simulation.
+        """
+        if prefix in self.data:
+            return prefix
+        exact = self.name_index.exact(prefix)
+        if len(exact) > 0 or len(prefix) < min_prefix_length:
+            return unique_key(exact, prefix)
+        for index in [self.uuid_index, self.name_index]:
+            try:
+                return index.resolve(prefix)
+            except KeyError:
+                pass
+        raise CacheMiss("Nothing found for", prefix)
+
+    def complete(self, prefix):
+        """ Return uuids and names starting with prefix, e.g. for tab completion. """
+        return self.uuid_index.complete(prefix) + self.name_index.complete(prefix)
+
+    @property
+    def completion_file(self):
+        """ File listing short uuids and names for the shell completion. """
+        return os.path.splitext(self.cache_file)[0] + ".completion"
+
+    def save(self):
+        """ Save the cache and update the completion index. """
+        changes = self.changes
+        super().save()
+        with locked(self.cache_file):
+            self.update_completion(changes)
+
+    def update_completion(self, changes):
+        """ Bring the completion index up to date after saving changes.
+
+        While the changes go to the journal, the words of new entries are
+        appended to the index. Removed entries are only dropped when the
+        index is rewritten together with the cache file.
+        """
+        if os.path.exists(self.journal_file) and os.path.exists(
+                self.completion_file):
+            items = [(k, v) for k, v in changes.items() if v is not removed]
+            with open(self.completion_file, "a") as outfile:
+                outfile.write(completion_text(items))
+        else:
+            self.write_completion()
+
+    def write_completion(self):
+        """ Rewrite the completion index from all entries. """
+        with atomic_write(self.completion_file) as outfile:
+            outfile.write(completion_text(self.data.items()))
+
+    def search_index(self, fields):
+        """ Search index of the given fields, built on first use. """
+        fields = tuple(fields)
+        if fields not in self._search_indices:
+            self._search_indices[fields] = SearchIndex(self.data.items(),
+                                                       fields)
+        return self._search_indices[fields]
 
     def search(self,
                patterns,
@@ -268,88 +903,882 @@ class SimCache(JsonCache):
         """ Search through all information (key and all values) in the cache. """
         # make sure patterns is an iterable
         patterns = ensure_is_list(patterns)
-        matches = []
-        for sim in self.data.values():
-            for field in fields:
-                try:
-                    res = [re.search(p, sim[field]) is not None for p in patterns]
-                    success = all(res) if exclusive else any(res)
-                except KeyError:
-                    success = False
-                if success:
-                    matches.append(sim)
-                    break
-        if len(matches) == 0:
-            raise NoSimulationFoundError(
-                "No result found for '{}'".format(patterns))
-        if unique:
-            if len(matches) > 1:
-                raise ResultNotUniqueError(
-                    "Search result is not unique! {} results found.".format(
-                        len(matches)))
-            return matches[0]
+        index = self.search_index(fields)
+        matches = [
+            self.data[key]
+            for key in index.search(SearchQuery(patterns, exclusive))
+        ]
+        return select_matches(matches, patterns, unique)
+
+
+# characters which make a pattern a regular expression
+regex_special_chars = set(".^$*+?{}[]\\|()")
+
+# regex constructs which can behave differently in a haystack of joined fields
+regex_context_constructs = ["\\A", "\\Z", "(?<", "(?=", "(?!"]
+
+
+def completion_text(items):
+    """ Lines of the completion index for some cache entries.
+
+    Parameters
+    ----------
+    items : iterable of (str, dict)
+        Uuids and simulations.
+
+    Returns
+    -------
+    str
+        The short uuid and the name of each simulation on separate lines.
+    """
+    lines = []
+    for key, sim in items:
+        lines.append(key.split("-")[0])
+        name = sim.get("name")
+        if isinstance(name, str) and name != "" and "\n" not in name:
+            lines.append(name)
+    return "".join(line + "\n" for line in lines)
+
+
+class SearchQuery:
+    """ Search patterns compiled once for searching many simulations.
+
+    Patterns without special characters are matched as plain substrings.
+    """
+
+    def __init__(self, patterns, exclusive=False):
+        self.patterns = patterns
+        self.exclusive = exclusive
+        self.literals = [p for p in patterns if is_literal(p)]
+        self.regexes = [re.compile(p) for p in patterns if not is_literal(p)]
+        # regexes compiled for searching the joined fields of a simulation
+        # which match at least where they match a single field
+        self.haystack_regexes = [
+            re.compile(p, re.MULTILINE) if haystack_safe(p) else None
+            for p in patterns if not is_literal(p)
+        ]
+
+    def match_field(self, value):
+        """ Evaluate the patterns for a single field value. """
+        res = [p in value for p in self.literals
+               ] + [r.search(value) is not None for r in self.regexes]
+        return all(res) if self.exclusive else any(res)
+
+    def match(self, sim, fields):
+        """ Return True if any of the fields of sim matches the patterns. """
+        for field in fields:
+            value = sim.get(field)
+            if isinstance(value, str) and self.match_field(value):
+                return True
+        return False
+
+
+def is_literal(pattern):
+    """ Check whether a pattern contains no regex special characters. """
+    return not any(c in regex_special_chars for c in pattern)
+
+
+def haystack_safe(pattern):
+    """ Check whether a regex can be used on fields joined by newlines. """
+    return not any(c in pattern for c in regex_context_constructs)
+
+
+class SearchIndex:
+    """ The searched fields of all simulations joined into one string.
+
+    Each simulation is one block of newline separated fields.
+    Literal patterns are found with str.find on the whole string
+    and regexes are run on the block of each simulation without copying.
+    Both yield candidates which are verified field by field only
+    where the haystack match is not exact.
+    """
+
+    def __init__(self, items, fields):
+        self.fields = fields
+        self.keys = []
+        self.sims = []
+        self.offsets = []
+        blocks = []
+        pos = 0
+        for key, sim in items:
+            values = [sim.get(f) for f in fields]
+            block = "\n".join(v for v in values if isinstance(v, str))
+            self.keys.append(key)
+            self.sims.append(sim)
+            self.offsets.append(pos)
+            blocks.append(block)
+            pos += len(block) + 1
+        self.offsets.append(pos)
+        self.haystack = "\n".join(blocks) + "\n"
+
+    def find_literal(self, literal):
+        """ Indices of simulations with a field containing literal. """
+        rv = set()
+        if literal == "" or "\n" in literal:
+            return set(n for n in range(len(self.keys))
+                       if SearchQuery([literal]).match(self.sims[n], self.fields))
+        pos = self.haystack.find(literal)
+        while pos >= 0:
+            n = bisect.bisect_right(self.offsets, pos) - 1
+            rv.add(n)
+            pos = self.haystack.find(literal, self.offsets[n + 1])
+        return rv
+
+    def find_regex(self, regex):
+        """ Indices of simulations whose joined fields match regex. """
+        if regex is None:
+            return set(range(len(self.keys)))
+        search = regex.search
+        haystack = self.haystack
+        offsets = self.offsets
+        return set(n for n in range(len(self.keys))
+                   if search(haystack, offsets[n], offsets[n + 1] - 1))
+
+    def search(self, query):
+        """ Return the keys of all simulations matching the query. """
+        literal_hits = [self.find_literal(p) for p in query.literals]
+        regex_hits = [self.find_regex(r) for r in query.haystack_regexes]
+        if query.exclusive:
+            candidates = set(range(len(self.keys))).intersection(
+                *(literal_hits + regex_hits))
+            # all patterns have to match in the same field
+            verify = len(query.patterns) > 1 or len(query.regexes) > 0
         else:
-            return matches
+            exact = set().union(*literal_hits)
+            candidates = set().union(*regex_hits) - exact
+            verify = True
+        if verify:
+            candidates = set(n for n in candidates
+                             if query.match(self.sims[n], self.fields))
+        if not query.exclusive:
+            candidates |= exact
+        return [self.keys[n] for n in sorted(candidates)]
+
+
+def select_matches(matches, patterns, unique):
+    """ Apply the result rules of SimCache.search to a list of matches. """
+    if len(matches) == 0:
+        raise NoSimulationFoundError(
+            "No result found for '{}'".format(patterns))
+    if unique:
+        if len(matches) > 1:
+            raise ResultNotUniqueError(
+                "Search result is not unique! {} results found.".format(
+                    len(matches)))
+        return matches[0]
+    else:
+        return matches
+
+
+sqlite_schema = """
+CREATE TABLE IF NOT EXISTS sims (
+    uuid TEXT PRIMARY KEY,
+    short TEXT NOT NULL,
+    name TEXT,
+    host TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sims_short ON sims (short);
+CREATE INDEX IF NOT EXISTS sims_name ON sims (name);
+CREATE INDEX IF NOT EXISTS sims_host ON sims (host);
+CREATE TABLE IF NOT EXISTS tags (
+    uuid TEXT NOT NULL,
+    tag TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag);
+CREATE INDEX IF NOT EXISTS tags_uuid ON tags (uuid);
+CREATE TABLE IF NOT EXISTS tokens (
+    uuid TEXT NOT NULL,
+    field TEXT NOT NULL,
+    token TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tokens_postings ON tokens (token, field, uuid);
+CREATE INDEX IF NOT EXISTS tokens_uuid ON tokens (uuid);
+CREATE TABLE IF NOT EXISTS vocabulary (
+    token TEXT PRIMARY KEY
+) WITHOUT ROWID;
+"""
+
+# version of the sqlite schema stored in the user_version pragma
+sqlite_schema_version = 2
+
+# fields in the token index
+token_fields = ["name", "tags", "simcode", "host"]
+
+# characters separating the tokens of a field for the token index
+token_separators = re.compile(r"[\s,_\-/:;=]+")
+
+
+def tokenize(value):
+    """ Split a field value into the tokens of the token index. """
+    return set(t for t in token_separators.split(value) if t != "")
+
+
+def is_token_query(pattern):
+    """ Check whether a pattern can be answered with the token index.
+
+    This is the case for plain strings without separator characters,
+    because such a string is part of a field exactly if it is part of one of its tokens.
+    Fields outside the token index are searched in the stored json text,
+    so the pattern must not contain characters which json escapes.
+    """
+    return (pattern != "" and is_literal(pattern) and pattern.isascii()
+            and '"' not in pattern and token_separators.search(pattern) is None)
+
+
+class SqliteSimCache(SimCache):
+    """ A cache for simulations stored in a sqlite database.
+
+    Lookups by uuid, short uuid, name, host and tag use indexes,
+    so opening the cache and requesting an item does not depend on its size.
+    An inverted index maps the tokens of names, tags, simcodes and hosts to uuids
+    and answers searches for plain strings without loading all simulations.
+    The database file is the cache file with the extension replaced by '.sqlite'.
+    """
+    in_memory = False
+
+    def load(self):
+        """ Open the database and create the tables if needed. """
+        import sqlite3
+        self.db_file = os.path.splitext(self.cache_file)[0] + ".sqlite"
+        self.db = sqlite3.connect(self.db_file)
+        self.db.executescript(sqlite_schema)
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version < sqlite_schema_version:
+            self.upgrade_schema()
+        # entries for the completion index since the last save
+        self.completion_added = []
+        self.completion_removed = False
+
+    def upgrade_schema(self):
+        """ Fill the token index of a database created by an older version. """
+        self.db.execute("DROP INDEX IF EXISTS tokens_token")
+        self.db.execute("DELETE FROM tokens")
+        self.db.execute("DELETE FROM vocabulary")
+        for key, value in self.db.execute("SELECT uuid, data FROM sims").fetchall():
+            self.insert_tokens(key, json.loads(value))
+        self.db.execute("PRAGMA user_version = {:d}".format(sqlite_schema_version))
+        self.db.commit()
+
+    def insert_tokens(self, key, value):
+        self.remove_tokens(key)
+        rows = []
+        for field in token_fields:
+            if isinstance(value.get(field), str):
+                rows += [(key, field, t) for t in tokenize(value[field])]
+        self.db.executemany(
+            "INSERT INTO tokens (uuid, field, token) VALUES (?, ?, ?)", rows)
+        self.db.executemany(
+            "INSERT OR IGNORE INTO vocabulary (token) VALUES (?)",
+            set((row[2], ) for row in rows))
+
+    def remove_tokens(self, key):
+        """ Remove the tokens of a simulation and the words nobody else uses. """
+        words = [(t, t) for t, in self.db.execute(
+            "SELECT DISTINCT token FROM tokens WHERE uuid = ?", (key, ))]
+        self.db.execute("DELETE FROM tokens WHERE uuid = ?", (key, ))
+        self.db.executemany(
+            "DELETE FROM vocabulary WHERE token = ? AND NOT EXISTS "
+            "(SELECT 1 FROM tokens WHERE token = ?)", words)
+
+    def save(self):
+        """ Commit pending changes to the database and update the completion index.
+
+        The words of new entries are appended to the index.
+        It is only rewritten after removals or if it does not exist.
+        """
+        self.db.commit()
+        self.pending_changes = 0
+        with locked(self.cache_file):
+            if self.completion_removed or not os.path.exists(
+                    self.completion_file):
+                self.write_completion()
+            elif len(self.completion_added) > 0:
+                with open(self.completion_file, "a") as outfile:
+                    outfile.write(completion_text(self.completion_added))
+        self.completion_added = []
+        self.completion_removed = False
+
+    def write_completion(self):
+        """ Rewrite the completion index from the uuid and name columns. """
+        with atomic_write(self.completion_file) as outfile:
+            for short, name in self.db.execute("SELECT short, name FROM sims"):
+                outfile.write(short + "\n")
+                if name is not None and name != "" and "\n" not in name:
+                    outfile.write(name + "\n")
+
+    def create_map(self):
+        """ Short uuids are indexed in the database, no map needed. """
+        pass
+
+    def is_stale(self):
+        """ Queries always go to the database, so it is never stale. """
+        return False
+
+    @property
+    def data(self):
+        """ All entries as a dict. This reads the whole database. """
+        return {
+            key: json.loads(value)
+            for key, value in self.db.execute("SELECT uuid, data FROM sims")
+        }
+
+    def prefix_query(self, column, prefix, limit=None):
+        """ Return the uuids and values of column for values starting with prefix. """
+        query = ("SELECT uuid, {0} FROM sims WHERE {0} >= ? AND {0} < ? "
+                 "ORDER BY {0}").format(column)
+        if limit is not None:
+            query += " LIMIT {:d}".format(limit)
+        return self.db.execute(query, (prefix, prefix + chr(0x10ffff))).fetchall()
+
+    def map_key(self, key):
+        """ Get full uuid if its a shortened id. """
+        if len(key) < min_prefix_length:
+            return key
+        rows = self.prefix_query("uuid", key, limit=2)
+        if len(rows) == 0:
+            return key
+        return unique_key([r[0] for r in rows], key)
+
+    def resolve(self, prefix):
+        """ Get the uuid of the simulation identified by a uuid or name prefix.
+
+        See SimCache.resolve.
+        """
+        exact = [
+            r[0] for r in self.db.execute("SELECT uuid FROM sims WHERE name = ?",
+                                          (prefix, ))
+        ]
+        if len(exact) > 0 or len(prefix) < min_prefix_length:
+            return unique_key(exact, prefix)
+        for column in ["uuid", "name"]:
+            rows = self.prefix_query(column, prefix, limit=2)
+            if len(rows) > 0:
+                return unique_key([r[0] for r in rows], prefix)
+        raise CacheMiss("Nothing found for", prefix)
+
+    def complete(self, prefix):
+        """ Return uuids and names starting with prefix, e.g. for tab completion. """
+        return [r[1] for r in self.prefix_query("uuid", prefix)
+                ] + [r[1] for r in self.prefix_query("name", prefix)]
+
+    def request(self, req):
+        """ Request the simulation with uuid or short uuid 'req'. """
+        row = self.db.execute("SELECT data FROM sims WHERE uuid = ?",
+                              (self.map_key(req), )).fetchone()
+        if row is None:
+            raise CacheMiss("Nothing found for", req)
+        return json.loads(row[0])
+
+    def regex_request(self, req):
+        """ Like request, but check for 'req' regex match any key """
+        pattern = re.compile(req)
+        for key, value in self.db.execute("SELECT uuid, data FROM sims"):
+            if re.search(pattern, key):
+                return json.loads(value)
+        raise CacheMiss("Nothing found for", req)
+
+    def contains(self, key):
+        """ Return True if the cache contains key, false otherwise. """
+        try:
+            key = self.map_key(key)
+        except ResultNotUniqueError:
+            return False
+        row = self.db.execute("SELECT 1 FROM sims WHERE uuid = ?",
+                              (key, )).fetchone()
+        return row is not None
+
+    def insert(self, key, value):
+        """ Insert a simulation and commit unless saving is deferred. """
+        key = self.canonical_key(key)
+        self.db.execute("DELETE FROM tags WHERE uuid = ?", (key, ))
+        self.db.execute(
+            "INSERT OR REPLACE INTO sims (uuid, short, name, host, data) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, key.split("-")[0], value.get("name"), value.get("host"),
+             json.dumps(value, default=dict)))
+        tags = [t for t in value.get("tags", "").split(", ") if t != ""]
+        self.db.executemany("INSERT INTO tags (uuid, tag) VALUES (?, ?)",
+                            [(key, t) for t in tags])
+        self.insert_tokens(key, value)
+        self.completion_added.append((key, value))
+        self.changed()
+
+    def remove(self, key):
+        """ Remove the simulation and commit unless saving is deferred. """
+        key = self.map_key(key)
+        if self.db.execute("DELETE FROM sims WHERE uuid = ?",
+                           (key, )).rowcount > 0:
+            self.completion_removed = True
+        self.db.execute("DELETE FROM tags WHERE uuid = ?", (key, ))
+        self.remove_tokens(key)
+        self.changed()
+
+    def find(self, field, value):
+        """ Return all simulations with an exact value for an indexed field.
+
+        Parameters
+        ----------
+        field : str
+            One of 'uuid', 'short', 'name', 'host' or 'tags'.
+        value : str
+            Value to look for. For 'tags' this is a single tag.
+
+        Returns
+        -------
+        list of dict
+        """
+        if field == "tags":
+            query = ("SELECT data FROM sims WHERE uuid IN "
+                     "(SELECT uuid FROM tags WHERE tag = ?)")
+        elif field in ["uuid", "short", "name", "host"]:
+            query = "SELECT data FROM sims WHERE {} = ?".format(field)
+        else:
+            raise KeyError("Field '{}' is not indexed".format(field))
+        return [json.loads(row[0]) for row in self.db.execute(query, (value, ))]
+
+    def search(self,
+               patterns,
+               fields=sim_attributes,
+               unique=False,
+               exclusive=False):
+        """ Search through all information (key and all values) in the cache. """
+        patterns = ensure_is_list(patterns)
+        token_patterns = [p for p in patterns if is_token_query(p)]
+        other_patterns = [p for p in patterns if not is_token_query(p)]
+        if len(token_patterns) == 0 or (exclusive and len(other_patterns) > 0):
+            matches = self.scan_search(patterns, fields, exclusive)
+            return select_matches(matches, patterns, unique)
+        keys = self.token_search(token_patterns, fields, exclusive)
+        if len(other_patterns) > 0:
+            keys |= set(
+                s["uuid"] for s in self.scan_search(other_patterns, fields))
+        return select_matches(self.request_many(keys), patterns, unique)
+
+    def scan_search(self, patterns, fields, exclusive=False):
+        """ Search by loading all simulations and scanning them. """
+        data = self.data
+        index = SearchIndex(data.items(), tuple(fields))
+        return [
+            data[key] for key in index.search(SearchQuery(patterns, exclusive))
+        ]
+
+    def token_search(self, patterns, fields, exclusive=False):
+        """ Find simulations with fields containing the patterns using the token index.
+
+        Parameters
+        ----------
+        patterns : list of str
+            Patterns for which is_token_query is True.
+        fields : list of str
+            Fields to search in.
+        exclusive : bool
+            Require all patterns to match the same field instead of any.
+
+        Returns
+        -------
+        set of str
+            The uuids of the matching simulations.
+        """
+        indexed = [f for f in fields if f in token_fields]
+        not_indexed = [f for f in fields if f not in token_fields]
+        hits = {field: [] for field in fields}
+        for p in patterns:
+            found = {field: set() for field in fields}
+            if len(indexed) > 0:
+                # scan the distinct words and look up their postings in the index
+                words = [t for t, in self.db.execute(
+                    "SELECT token FROM vocabulary WHERE instr(token, ?) > 0",
+                    (p, ))]
+                rows = self.select_in(
+                    "SELECT field, uuid FROM tokens WHERE token IN ({})", words)
+                for field, key in rows:
+                    if field in found:
+                        found[field].add(key)
+            if len(not_indexed) > 0:
+                # the pattern appears verbatim in the stored json text
+                rows = self.db.execute(
+                    "SELECT uuid, data FROM sims WHERE instr(data, ?) > 0",
+                    (p, ))
+                for key, data in rows:
+                    sim = json.loads(data)
+                    for field in not_indexed:
+                        value = sim.get(field)
+                        if isinstance(value, str) and p in value:
+                            found[field].add(key)
+            for field in fields:
+                hits[field].append(found[field])
+        rv = set()
+        for field_hits in hits.values():
+            if exclusive:
+                rv |= set.intersection(*field_hits)
+            else:
+                rv |= set.union(*field_hits)
+        return rv
+
+    def select_in(self, query, values):
+        """ Run a query with an 'IN ({})' clause for many values in chunks. """
+        values = list(values)
+        rows = []
+        chunk = 500
+        for n in range(0, len(values), chunk):
+            part = values[n:n + chunk]
+            rows += self.db.execute(
+                query.format(", ".join("?" * len(part))), part).fetchall()
+        return rows
+
+    def request_many(self, keys):
+        """ Return the simulations with the given uuids in insertion order. """
+        rows = self.select_in(
+            "SELECT rowid, data FROM sims WHERE uuid IN ({})", keys)
+        return [json.loads(data) for _, data in sorted(rows)]
+
+
+class BinarySimCache(SimCache):
+    """ A cache for simulations stored in the binary format of smurf.bincache.
+
+    The cache file is the json cache file with the extension replaced by '.bin'.
+    Requests by uuid are answered from the memory mapped file
+    until the whole cache is needed, e.g. for a search.
+    """
+
+    file_extension = ".bin"
+    # memory mapped table and the journal changes on top of it
+    _view = None
+
+    def load(self):
+        """ Discard the loaded content and the memory mapped file. """
+        super().load()
+        self.close_view()
+
+    def save(self):
+        """ Save the cache and discard the memory mapped file. """
+        super().save()
+        self.close_view()
+
+    def read_file(self):
+        """ Decode the whole cache file. """
+        from smurf.bincache import BinaryTable
+        try:
+            infile = open(self.cache_file, "rb")
+        except FileNotFoundError:
+            return {}, None
+        with infile:
+            st = os.fstat(infile.fileno())
+            signature = [st.st_mtime_ns, st.st_size, st.st_ino]
+            try:
+                table = BinaryTable(infile)
+            except ValueError:
+                return {}, signature
+        try:
+            return table.to_dict(), signature
+        finally:
+            table.close()
+
+    def write_file(self, data):
+        """ Atomically replace the cache file with new content. """
+        from smurf.bincache import dumps
+        with atomic_write(self.cache_file, mode="wb") as outfile:
+            outfile.write(dumps(data))
+
+    def view(self):
+        """ Return the memory mapped cache file and the journal changes on top of it.
+
+        The table is None if there is no valid cache file.
+        """
+        if self._view is None:
+            from smurf.bincache import BinaryTable
+            self.view_signature = self.file_signatures()
+            table = None
+            base = None
+            try:
+                with open(self.cache_file, "rb") as infile:
+                    st = os.fstat(infile.fileno())
+                    base = [st.st_mtime_ns, st.st_size, st.st_ino]
+                    table = BinaryTable(infile)
+            except (FileNotFoundError, ValueError):
+                pass
+            self._view = (table, self.read_journal(base))
+        return self._view
+
+    def close_view(self):
+        if self._view is not None and self._view[0] is not None:
+            self._view[0].close()
+        self._view = None
+
+    def is_stale(self):
+        """ Check whether the cache file changed since it was read or mapped. """
+        return super().is_stale() or (self._view is not None and
+                                      self.file_signatures() != self.view_signature)
+
+    def lookup(self, key):
+        """ Return the value for a full uuid without loading the cache or None. """
+        table, journal = self.view()
+        for changes in [self.changes, journal]:
+            if key in changes:
+                return None if changes[key] is removed else changes[key]
+        return table.get(key) if table is not None else None
+
+    def prefix_keys(self, prefix):
+        """ Return the uuids starting with prefix without loading the cache. """
+        table, journal = self.view()
+        keys = set()
+        if table is not None:
+            keys.update(k for k in table.prefix(prefix) if k.startswith(prefix))
+        for changes in [journal, self.changes]:
+            for key, value in changes.items():
+                if not key.startswith(prefix):
+                    continue
+                if value is removed:
+                    keys.discard(key)
+                else:
+                    keys.add(key)
+        return sorted(keys)
+
+    def map_key(self, key):
+        """ Get full uuid if its a shortened id. """
+        if self._data is not None:
+            return super().map_key(key)
+        if len(key) < min_prefix_length or self.lookup(key) is not None:
+            return key
+        keys = self.prefix_keys(key)
+        if len(keys) > 1:
+            raise ResultNotUniqueError(
+                "'{}' is ambiguous! It matches more than one entry.".format(
+                    key))
+        return keys[0] if len(keys) == 1 else key
+
+    def request(self, req):
+        """ Request a simulation by uuid or uuid prefix. """
+        if self._data is not None:
+            return super().request(req)
+        value = self.lookup(self.map_key(req))
+        if value is None:
+            raise CacheMiss("Nothing found for", req)
+        return value
+
+    def contains(self, key):
+        """ Return True if the cache contains key, false otherwise. """
+        if self._data is not None:
+            return super().contains(key)
+        try:
+            return self.lookup(self.map_key(key)) is not None
+        except ResultNotUniqueError:
+            return False
+
+
+def select_engine(cls):
+    """ Return the variant of a cache class for the configured cache engine.
+
+    The engine is set with the config key 'cache_engine'
+    which can be 'json' (default), 'binary' or 'sqlite'.
+    """
+    if cls not in engine_variants:
+        return cls
+    variants = engine_variants[cls]
+    engine = smurf.get_config().get("cache_engine")
+    try:
+        return variants[engine]
+    except KeyError:
+        raise ValueError("Unknown cache engine '{}'".format(engine))
 
 
 class LocalSimCache(SimCache):
     """ A cache for simulations on the local host. """
 
+    def __new__(cls):
+        return super().__new__(select_engine(cls))
+
     def __init__(self):
-        self.conf = smurf.Config()
+        self.conf = smurf.get_config()
         cache_file = os.path.join(self.conf["home_path"],
                                   self.conf["local_cache"])
         self.rootdir_list = self.conf["rootdir_list"]
-        super().__init__(cache_file)
-
-    def rebuild(self, base=None):
-        self.scrub()
-        self.generate(base=base)
+        super().__init__(cache_file,
+                         flush_threshold=self.conf.get("cache_flush_threshold"),
+                         journal_size=self.conf.get("cache_journal_size"))
+
+    def rebuild(self, base=None, incremental=False, nested=None, jobs=1):
+        with self.deferred_save():
+            self.scrub()
+            self.generate(base=base,
+                          incremental=incremental,
+                          nested=nested,
+                          jobs=jobs)
 
     def scrub(self):
         """ Verify each cache entry and delete nonexisting entries. """
-        for key, sim in list(self.data.items()):
-            if not os.path.exists(sim["path"]):
-                self.remove(key)
-
-    def generate(self, base=None):
+        with self.deferred_save():
+            for key, sim in list(self.data.items()):
+                if not os.path.exists(sim["path"]):
+                    self.remove(key)
+
+    def generate(self, base=None, incremental=False, nested=None, jobs=1):
+        """ Search the rootdirs for simdirs and add them to the cache.
+
+        Parameters
+        ----------
+        base : str
+            Only search inside this directory.
+        incremental : bool
+            Skip directories which did not change since the last walk
+            and simdirs which are unchanged and already cached.
+        nested : bool
+            Look for simdirs inside of simdirs.
+            Defaults to the config value 'nested_simdirs'.
+        jobs : int
+            Number of threads used to walk the directories and read the meta data.
+        """
         # only generate cache inside basedir if given
         if base is not None:
             bases = [base]
         else:
             bases = self.rootdir_list
-        for base in bases:
-            for root, _, _ in os.walk(base):
-                if siminfo.is_simdir(root):
-                    self.add_sim_to_cache(root)
+        state = ScanState(
+            os.path.join(self.conf["home_path"], self.conf.get("scan_state")))
+        previous = state.data if incremental else None
+        if nested is None:
+            nested = self.conf.get("nested_simdirs")
+        exclude = self.conf.get("exclude_list")
+        cached_paths = set(sim["path"] for sim in self.data.values())
+        walked = {}
+        found = find_simdirs_parallel(bases,
+                                      jobs,
+                                      previous,
+                                      walked,
+                                      nested=nested,
+                                      exclude=exclude)
+        to_add = [
+            simdir for simdir, changed in found
+            if changed or simdir not in cached_paths
+        ]
+        if jobs > 1:
+            from multiprocessing.pool import ThreadPool
+            with ThreadPool(jobs) as p:
+                entries = p.map(read_sim_entry, to_add)
+        else:
+            entries = map(read_sim_entry, to_add)
+        with self.deferred_save():
+            for entry in entries:
+                if entry is not None:
+                    self.insert(entry["uuid"], entry)
+        state.replace_trees(bases, walked)
+        state.save()
 
     def add_sim_to_cache(self, simdir):
-        info = siminfo.Info(simdir)
-        self.insert(
-            info.uuid, {
-                "uuid": info.uuid,
-                "name": info.name,
-                "path": info.path,
-                "host": "localhost",
-                "tags": ", ".join(info.tags),
-                "simcode": info.simcode
-            })
-        return info.uuid
+        entry = sim_entry(siminfo.Info(simdir))
+        self.insert(entry["uuid"], entry)
+        return entry["uuid"]
+
+
+def sim_entry(info):
+    """ Cache entry for a local simulation.
+
+    Parameters
+    ----------
+    info : smurf.info.Info
+        Info object of the simulation.
+
+    Returns
+    -------
+    dict
+    """
+    return {
+        "uuid": info.uuid,
+        "name": info.name,
+        "path": info.path,
+        "host": "localhost",
+        "tags": ", ".join(info.tags),
+        "simcode": info.simcode
+    }
+
+
+def read_sim_entry(simdir):
+    """ Read the cache entry of a simdir or return None if it vanished. """
+    try:
+        return sim_entry(siminfo.Info(simdir))
+    except FileNotFoundError:
+        return None
 
 
 class RemoteSimCache(SimCache):
     """ A cache for simulations on remote hosts. """
 
+    def __new__(cls):
+        return super().__new__(select_engine(cls))
+
     def __init__(self):
-        self.conf = smurf.Config()
+        self.conf = smurf.get_config()
         cache_file = os.path.join(self.conf["home_path"],
                                   self.conf["remote_cache"])
-        super().__init__(cache_file)
+        super().__init__(cache_file,
+                         flush_threshold=self.conf.get("cache_flush_threshold"),
+                         journal_size=self.conf.get("cache_journal_size"))
 
     def add_sim_to_cache(self, sim):
         self.insert(sim["uuid"], sim)
 
 
+class BinaryLocalSimCache(BinarySimCache, LocalSimCache):
+    """ A local simulation cache stored in the binary format. """
+    pass
+
+
+class BinaryRemoteSimCache(BinarySimCache, RemoteSimCache):
+    """ A remote simulation cache stored in the binary format. """
+    pass
+
+
+class SqliteLocalSimCache(SqliteSimCache, LocalSimCache):
+    """ A local simulation cache stored in a sqlite database. """
+    pass
+
+
+class SqliteRemoteSimCache(SqliteSimCache, RemoteSimCache):
+    """ A remote simulation cache stored in a sqlite database. """
+    pass
+
+
+# cache classes to use for each engine
+engine_variants = {
+    LocalSimCache: {
+        "json": LocalSimCache,
+        "binary": BinaryLocalSimCache,
+        "sqlite": SqliteLocalSimCache
+    },
+    RemoteSimCache: {
+        "json": RemoteSimCache,
+        "binary": BinaryRemoteSimCache,
+        "sqlite": SqliteRemoteSimCache
+    },
+}
+
+
+def convert_cache(cls, engine):
+    """ Copy the content of a cache to the files of another engine.
+
+    Parameters
+    ----------
+    cls : type
+        LocalSimCache or RemoteSimCache.
+    engine : str
+        Name of the engine to convert to.
+
+    Returns
+    -------
+    int
+        Number of entries copied.
+    """
+    data = cls().data
+    dst = engine_variants[cls][engine]()
+    with dst.deferred_save():
+        for key in list(dst.data):
+            dst.remove(key)
+        for key, value in data.items():
+            dst.insert(key, value)
+    return len(data)
+
+
 def ensure_is_list(x):
     """ Ensure that the argument is an iterable item with a length. 
 
@@ -371,6 +1800,35 @@ def ensure_is_list(x):
     return x
 
 
+# process wide cache instances by class
+shared_caches = {}
+
+
+def shared_cache(cls):
+    """ Return a process wide instance of a cache class.
+
+    The instance is reused as long as the config is unchanged
+    and reloaded only when its cache file changed on disk.
+
+    Parameters
+    ----------
+    cls : type
+        LocalSimCache or RemoteSimCache.
+
+    Returns
+    -------
+    smurf.cache.SimCache
+    """
+    conf = smurf.get_config()
+    c = shared_caches.get(cls)
+    if c is None or c.conf is not conf:
+        c = cls()
+        shared_caches[cls] = c
+    elif c.is_stale():
+        c.reload()
+    return c
+
+
 def get_cache_by_id(simid):
     """ Get the cache which contains the key.
 
@@ -383,11 +1841,11 @@ def get_cache_by_id(simid):
     -------
     smurf.cache.SimCache
     """
-    c = LocalSimCache()
+    c = shared_cache(LocalSimCache)
     if c.contains(simid):
         rv = c
     else:
-        c = RemoteSimCache()
+        c = shared_cache(RemoteSimCache)
         if c.contains(simid):
             rv = c
         else:
@@ -5,7 +5,36 @@ import json
 
 home_path = os.path.join(os.path.expanduser("~"), ".smurf")
 
-information_types = ["rootdir", "host"]
+information_types = ["rootdir", "host", "exclude"]
+
+# values used for config keys which are not set in the config file
+defaults = {
+    # storage backend of the simulation caches: 'json', 'binary' or 'sqlite'
+    "cache_engine": "json",
+    # directory info of the last cache generation used by incremental updates
+    "scan_state": "scan_state.json",
+    # search for simdirs inside of simdirs when generating the cache
+    "nested_simdirs": False,
+    # glob patterns of directories skipped when generating the cache
+    "exclude_list": [".git", "*.h5"],
+    # write all meta information into meta/info.json in addition to the single files
+    "info_json": False,
+    # number of cache changes after which a deferred save is written early
+    "cache_flush_threshold": 1000,
+    # seconds to wait for remote hosts to answer a global search
+    "search_timeout": 10,
+    # seconds after which an idle shared ssh connection is closed
+    "ssh_persist": 600,
+    # size in bytes up to which cache changes are appended to a journal
+    # before the cache file is rewritten, 0 disables the journal
+    "cache_journal_size": 1048576,
+    # seconds after which a mount which is not used anymore is unmounted
+    "mount_idle_timeout": 120,
+    # directory of local copies of remote files, defaults to data_cache in the smurf home dir
+    "data_cache_dir": None,
+    # size limit of the local copies in bytes
+    "data_cache_size": 10 * 1024**3,
+}
 
 
 def main():
@@ -21,7 +50,8 @@ def main():
 
 
 def parse_command_line_args():
-    import argparse, argcomplete
+    import argparse
+    from smurf._command_line_ import autocomplete
     import pprint
     parser = argparse.ArgumentParser()
     parser.set_defaults(func=Config.print)
@@ -48,7 +78,7 @@ def parse_command_line_args():
         'get', help='Return the value of a root level config item.')
     parser_get.add_argument("key", help="What to get.")
     parser_get.set_defaults(func=Config.print_value)
-    argcomplete.autocomplete(parser)
+    autocomplete(parser)
     args = parser.parse_args()
     return args
 
@@ -60,6 +90,32 @@ def expand_path(path):
     return abspath
 
 
+def file_signature(path):
+    """ Return modification time, size and inode of a file or None if it does not exist. """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+# process wide config instances by config file
+shared_configs = {}
+
+
+def get_config():
+    """ Return a process wide Config instance.
+
+    The config file is only read again if it changed on disk.
+    """
+    config_file = os.path.join(home_path, "config.json")
+    conf = shared_configs.get(config_file)
+    if conf is None or conf.signature != file_signature(config_file):
+        conf = Config()
+        shared_configs[config_file] = conf
+    return conf
+
+
 def check_information_type(info_type):
     if not any((info_type == t for t in information_types)):
         raise AttributeError(
@@ -77,10 +133,10 @@ class Config:
         check_information_type(what)
         if what == "rootdir":
             self.add_rootdir(val)
-        elif what == "host":
+        elif what in ["host", "exclude"]:
             list_name = what + "_list"
             if not list_name in self.data:
-                self.data[list_name] = []
+                self.data[list_name] = list(defaults.get(list_name, []))
             self.data[list_name].append(val)
         else:
             self.data[what] = val
@@ -89,6 +145,8 @@ class Config:
     def remove(self, what, val):
         check_information_type(what)
         list_name = what + "_list"
+        if not list_name in self.data and list_name in defaults:
+            self.data[list_name] = list(defaults[list_name])
         try:
             for n in range(len(self.data[list_name])):
                 if self.data[list_name][n] == val:
@@ -120,6 +178,10 @@ class Config:
     def __getitem__(self, key):
         return self.data[key]
 
+    def get(self, key, default=None):
+        """ Return the value for key or the built-in default if it is not set. """
+        return self.data.get(key, defaults.get(key, default))
+
     def __setitem__(self, key, val):
         self.data[key] = val
 
@@ -128,8 +190,10 @@ class Config:
         self.data["version"] = "0.1"
         with open(self.config_file, "w") as outfile:
             outfile.write(json.dumps(self.data, indent=4))
+        self.signature = file_signature(self.config_file)
 
     def load(self):
+        self.signature = file_signature(self.config_file)
         try:
             with open(self.config_file, "r") as infile:
                 self.data = json.load(infile)
@@ -0,0 +1,443 @@
+""" Daemon which keeps the caches loaded and answers queries over a unix socket.
+
+Start it with 'smurf daemon start'. While it runs, the smurf command
+runs searches and info queries inside of the daemon, so the interpreter
+startup, the imports and the parsing of the cache files are skipped.
+The caches and the config are reloaded when their files change.
+
+Commands run in a forked child of the daemon, so a slow global search
+does not hold up other requests and a failing command cannot bring the
+daemon down.
+
+Each request is a json object sent by the client which then closes its
+writing end. The answer is a sequence of json lines with output
+('stdout' or 'stderr') followed by a final line with the exit 'code'.
+"""
+import os
+import sys
+import json
+
+import smurf.config
+
+# subcommands which the command line runs in the daemon if it is running
+served_commands = ["search", "info"]
+
+# seconds the daemon waits for a client to send its request
+request_timeout = 5
+
+# seconds a client waits for the next part of an answer,
+# longer than a global search waits for the hosts by default
+client_timeout = 30
+
+
+def socket_path():
+    return os.path.join(smurf.config.home_path, "daemon.sock")
+
+
+def main():
+    args = parse_command_line_args()
+    if args.action == "run":
+        serve()
+    elif args.action == "start":
+        start()
+    elif args.action == "stop":
+        if query({"shutdown": True}) is None:
+            print("smurf daemon is not running")
+    elif args.action == "status":
+        rv = query({"ping": True})
+        if rv is None:
+            print("smurf daemon is not running")
+            sys.exit(1)
+        print("smurf daemon is running with pid {}".format(rv["pid"]))
+
+
+def parse_command_line_args():
+    import argparse
+    from smurf._command_line_ import autocomplete
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "action",
+        choices=["start", "stop", "status", "run"],
+        help="Start the daemon in the background, stop it, "
+        "show whether it is running or run it in the foreground.")
+    autocomplete(parser)
+    args = parser.parse_args()
+    return args
+
+
+def start():
+    """ Start the daemon as a detached process and wait until it answers. """
+    import time
+    from smurf.doublefork import detachify
+    if query({"ping": True}) is not None:
+        print("smurf daemon is already running")
+        return
+    detachify(serve_detached)()
+    for n in range(50):
+        rv = query({"ping": True})
+        if rv is not None:
+            print("smurf daemon started with pid {}".format(rv["pid"]))
+            return
+        time.sleep(0.1)
+    print("smurf daemon did not start", file=sys.stderr)
+    sys.exit(1)
+
+
+def serve_detached(target=None):
+    """ Run a server in a new session without a terminal, then exit. """
+    os.setsid()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in [0, 1, 2]:
+        os.dup2(devnull, fd)
+    try:
+        (serve if target is None else target)()
+    finally:
+        os._exit(0)
+
+
+def serve(path=None, commands=None):
+    """ Answer requests on the socket until a shutdown request arrives.
+
+    Parameters
+    ----------
+    path : str
+        Path of the socket. Defaults to daemon.sock in the smurf home dir.
+    commands : list of str
+        Subcommands which may be run. Defaults to served_commands.
+    """
+    path = socket_path() if path is None else path
+    commands = served_commands if commands is None else commands
+    import socket
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        if query({"ping": True}, path=path) is not None:
+            raise RuntimeError("smurf daemon is already running")
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o077)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(old_umask)
+    server.listen()
+    preload()
+    children = set()
+    try:
+        running = True
+        while running:
+            conn, _ = server.accept()
+            with conn:
+                # a client which does not send its request must not block the others
+                conn.settimeout(request_timeout)
+                try:
+                    running = handle(conn, commands, children)
+                except Exception as e:
+                    # e.g. a malformed request, keep serving the others
+                    SocketWriter(conn, "stdout").send({
+                        "code": 1,
+                        "error": str(e)
+                    })
+            reap(children)
+    finally:
+        server.close()
+        os.remove(path)
+
+
+def preload():
+    """ Load the caches and build their indices.
+
+    The entries are kept as compact SimRecord objects.
+    Caches which are not kept in memory, e.g. sqlite databases,
+    are queried directly and need no preloading.
+    """
+    import smurf.cache as cache
+    cache.SimCache.compact = True
+    for cls in [cache.LocalSimCache, cache.RemoteSimCache]:
+        c = cache.shared_cache(cls)
+        if not c.in_memory:
+            continue
+        c.data
+        c.search_index(cache.sim_attributes)
+        c.name_index
+
+
+def handle(conn, commands, children):
+    """ Answer a single request.
+
+    Commands are started in a child process whose pid is added to children.
+
+    Returns
+    -------
+    bool
+        False if the daemon should shut down.
+    """
+    request = json.loads(receive_all(conn))
+    out = SocketWriter(conn, "stdout")
+    if "shutdown" in request:
+        out.send({"code": 0})
+        return False
+    if "ping" in request:
+        out.send({"code": 0, "pid": os.getpid()})
+    elif "resolve" in request:
+        out.send(resolve_request(request["resolve"]))
+    else:
+        children.add(fork_command(conn, request, commands))
+    return True
+
+
+def fork_command(conn, request, commands):
+    """ Run a command in a child process which answers the client.
+
+    The caches are refreshed first, so the child finds them up to date.
+
+    Returns
+    -------
+    int
+        Pid of the child.
+    """
+    import smurf.cache as cache
+    preload()
+    pid = os.fork()
+    if pid != 0:
+        return pid
+    conn.settimeout(client_timeout)
+    # database connections of the parent must not be used after a fork,
+    # they are kept referenced but unused and new ones are opened
+    inherited = [
+        cache.shared_caches.pop(cls) for cls in list(cache.shared_caches)
+        if not cache.shared_caches[cls].in_memory
+    ]
+    code = 1
+    try:
+        code = run_command(conn, request, commands)
+    except BaseException as e:
+        SocketWriter(conn, "stderr").send({"stderr": "{}\n".format(e)})
+    finally:
+        SocketWriter(conn, "stdout").send({"code": code})
+        os._exit(0)
+
+
+def reap(children):
+    """ Collect the exit status of finished children. """
+    for pid in list(children):
+        try:
+            done, _ = os.waitpid(pid, os.WNOHANG)
+        except ChildProcessError:
+            done = pid
+        if done != 0:
+            children.discard(pid)
+
+
+def run_command(conn, request, commands):
+    """ Run a subcommand with its output going to the client.
+
+    Returns
+    -------
+    int
+        Exit code of the command.
+    """
+    import importlib
+    import traceback
+    from contextlib import redirect_stdout, redirect_stderr
+    name, args = request["argv"][0], request["argv"][1:]
+    out = SocketWriter(conn, "stdout")
+    err = SocketWriter(conn, "stderr")
+    if name not in commands:
+        err.write("smurf daemon does not run '{}'\n".format(name))
+        return 1
+    old_argv = sys.argv
+    old_cwd = os.getcwd()
+    code = 0
+    try:
+        os.chdir(request["cwd"])
+        script = os.path.join(os.path.dirname(__file__), name + ".py")
+        sys.argv = [script] + args
+        with redirect_stdout(out), redirect_stderr(err):
+            try:
+                importlib.import_module("smurf." + name).main()
+            except SystemExit as e:
+                code = exit_code(e, err)
+            except Exception:
+                traceback.print_exc()
+                code = 1
+        out.flush()
+        err.flush()
+    finally:
+        sys.argv = old_argv
+        os.chdir(old_cwd)
+    return code
+
+
+def exit_code(e, err):
+    """ Exit code of a SystemExit like the interpreter would return it. """
+    if e.code is None:
+        return 0
+    if isinstance(e.code, int):
+        return e.code
+    print(e.code, file=err)
+    return 1
+
+
+def resolve_request(prefix):
+    import smurf.cache as cache
+    try:
+        return {"code": 0, "uuid": resolve_local(prefix)}
+    except (cache.CacheMiss, cache.ResultNotUniqueError) as e:
+        return {"code": 1, "error": type(e).__name__, "message": str(e)}
+
+
+def resolve_local(prefix):
+    """ Resolve a prefix with the caches of this process. """
+    import smurf.cache as cache
+    for cls in [cache.LocalSimCache, cache.RemoteSimCache]:
+        try:
+            return cache.shared_cache(cls).resolve(prefix)
+        except cache.CacheMiss:
+            pass
+    raise cache.CacheMiss("Nothing found for", prefix)
+
+
+def resolve(prefix):
+    """ Get the uuid of a cached simulation from a uuid or name prefix.
+
+    The daemon is asked if it is running.
+
+    Raises
+    ------
+    smurf.cache.CacheMiss
+        If no simulation matches.
+    smurf.cache.ResultNotUniqueError
+        If the prefix matches more than one simulation.
+    """
+    rv = query({"resolve": prefix})
+    if rv is None:
+        return resolve_local(prefix)
+    if rv["code"] != 0:
+        import smurf.cache as cache
+        raise getattr(cache, rv["error"])(rv["message"])
+    return rv["uuid"]
+
+
+class SocketWriter:
+    """ File like object which sends everything written as json lines.
+
+    Output is sent line by line, so results are streamed to the client.
+    """
+
+    def __init__(self, conn, stream):
+        self.conn = conn
+        self.stream = stream
+        self.closed = False
+        self.buffer = []
+
+    def write(self, s):
+        self.buffer.append(s)
+        if "\n" in s:
+            self.flush()
+        return len(s)
+
+    def flush(self):
+        text = "".join(self.buffer)
+        self.buffer = []
+        if len(text) > 0:
+            self.send({self.stream: text})
+
+    def send(self, obj):
+        if self.closed:
+            return
+        try:
+            self.conn.sendall((json.dumps(obj) + "\n").encode())
+        except OSError:
+            # the client went away, discard the rest of the output
+            self.closed = True
+
+
+def receive_all(conn):
+    chunks = []
+    while True:
+        data = conn.recv(65536)
+        if len(data) == 0:
+            return b"".join(chunks).decode()
+        chunks.append(data)
+
+
+def connect(path):
+    """ Return a socket connected to the daemon or None if it is not running. """
+    if not os.path.exists(path):
+        return None
+    import socket
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.settimeout(1)
+        conn.connect(path)
+        conn.settimeout(client_timeout)
+    except OSError:
+        conn.close()
+        return None
+    return conn
+
+
+def send_request(request, path=None):
+    """ Send a request and iterate over the answer lines.
+
+    Yields nothing if the daemon is not running.
+    """
+    conn = connect(socket_path() if path is None else path)
+    if conn is None:
+        return
+    from socket import SHUT_WR
+    with conn:
+        try:
+            conn.sendall(json.dumps(request).encode())
+            conn.shutdown(SHUT_WR)
+            with conn.makefile("r") as infile:
+                for line in infile:
+                    yield json.loads(line)
+        except (OSError, ValueError):
+            return
+
+
+def query(request, path=None):
+    """ Send a request and return the final answer or None if the daemon is not running. """
+    rv = None
+    for rv in send_request(request, path=path):
+        pass
+    if rv is None or "code" not in rv:
+        return None
+    return rv
+
+
+def run_in_daemon(name, args, path=None):
+    """ Run a subcommand in the daemon and pass on its output.
+
+    Parameters
+    ----------
+    name : str
+        Name of the subcommand.
+    args : list of str
+        Its command line arguments.
+
+    Returns
+    -------
+    int
+        The exit code or None if the command was not run,
+        e.g. because the daemon is not running.
+    """
+    if name not in served_commands or "_ARGCOMPLETE" in os.environ:
+        return None
+    request = {"argv": [name] + list(args), "cwd": os.getcwd()}
+    started = False
+    for answer in send_request(request, path=path):
+        if "code" in answer:
+            return answer["code"]
+        for stream in ["stdout", "stderr"]:
+            if stream in answer:
+                started = True
+                f = getattr(sys, stream)
+                f.write(answer[stream])
+                f.flush()
+    if started:
+        # running the command again would repeat the output
+        print("smurf daemon stopped answering", file=sys.stderr)
+        return 1
+    return None
@@ -0,0 +1,360 @@
+""" Local copies of files of remote simulations.
+
+Files read through a mount are copied into a cache directory,
+so later runs read them from the local disk.
+A copy is identified by the host, the path, the size and the
+modification time of the file, so changed files are copied again.
+When the cache grows past its size limit, the least recently
+used files are removed, except for pinned ones which are in use.
+Many files can be fetched at once with a Prefetch.
+"""
+import os
+import sys
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+import smurf
+import smurf.config
+
+
+class DataCache:
+    """ Directory of cached file copies with a size limit.
+
+    The size bookkeeping and the eviction are guarded by a lock,
+    so copies can be fetched from several threads.
+    Pinned copies are not evicted by this process.
+    """
+
+    def __init__(self, cache_dir, max_size):
+        """
+        Parameters
+        ----------
+        cache_dir : str
+            Directory holding the copies.
+        max_size : int
+            Size limit in bytes.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        # estimated size of the cache, computed on the first insertion
+        self.size = None
+        # number of pins of the copies in use
+        self.pins = {}
+        self.lock = threading.Lock()
+
+    def file_name(self, host, path, st):
+        """ Path of the copy of a file with the given stat result. """
+        key = "\0".join([host, path, str(st.st_size), str(st.st_mtime_ns)])
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest[2:])
+
+    def get(self, host, path, st, pin=False):
+        """ Return the path of the copy of a file or None if it is not cached.
+
+        If pin is set, the copy is pinned until unpin is called.
+        """
+        name = self.file_name(host, path, st)
+        with self.lock:
+            try:
+                # the modification time of the copy records its last use
+                os.utime(name)
+            except FileNotFoundError:
+                return None
+            if pin:
+                self.pins[name] = self.pins.get(name, 0) + 1
+        return name
+
+    def pin(self, name):
+        """ Protect a copy from eviction until unpin is called. """
+        with self.lock:
+            self.pins[name] = self.pins.get(name, 0) + 1
+
+    def unpin(self, name):
+        """ Release a pin of a copy, paths which are not pinned are ignored. """
+        with self.lock:
+            count = self.pins.get(name, 0)
+            if count > 1:
+                self.pins[name] = count - 1
+            else:
+                self.pins.pop(name, None)
+
+    def fetch(self, host, path, source, pin=False):
+        """ Return the path of a local copy of a file, copying it if needed.
+
+        Parameters
+        ----------
+        host : str
+            Host of the file.
+        path : str
+            Path of the file on the host.
+        source : str
+            Path to read the file from, e.g. inside of a mount.
+        pin : bool
+            Pin the copy until unpin is called.
+
+        Returns
+        -------
+        str
+            Path of the copy or source if the file changed while copying.
+        """
+        st = os.stat(source)
+        cached = self.get(host, path, st, pin=pin)
+        if cached is not None:
+            return cached
+        name = self.file_name(host, path, st)
+        os.makedirs(os.path.dirname(name), exist_ok=True)
+        # copies are not synced to disk, a lost copy is fetched again
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(name), prefix=".tmp")
+        pinned = False
+        try:
+            with os.fdopen(fd, "wb") as outfile, open(source, "rb") as infile:
+                shutil.copyfileobj(infile, outfile, 1 << 20)
+            if not same_file_version(st, os.stat(source)):
+                os.remove(tmp)
+                return source
+            if pin:
+                # before the copy is visible to an eviction
+                self.pin(name)
+                pinned = True
+            os.replace(tmp, name)
+        except BaseException:
+            if pinned:
+                self.unpin(name)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.added(st.st_size, name)
+        return name
+
+    def added(self, size, name):
+        """ Account for a new copy and remove old ones if the cache is too large. """
+        with self.lock:
+            if self.size is None:
+                self.size = sum(st.st_size for _, st in self.entries())
+            else:
+                self.size += size
+            if self.size > self.max_size:
+                self.evict(keep=name)
+
+    def entries(self):
+        """ Yield path and stat result of all copies. """
+        try:
+            subdirs = list(os.scandir(self.cache_dir))
+        except FileNotFoundError:
+            return
+        for d in subdirs:
+            if not d.is_dir():
+                continue
+            for e in os.scandir(d.path):
+                if e.name.startswith(".tmp"):
+                    # being copied
+                    continue
+                try:
+                    yield e.path, e.stat()
+                except FileNotFoundError:
+                    pass
+
+    def evict(self, keep=None):
+        """ Remove the least recently used copies until the cache fits its limit.
+
+        Pinned copies are kept. The caller holds the lock.
+
+        Parameters
+        ----------
+        keep : str
+            Copy not to remove, e.g. the one just made.
+        """
+        entries = sorted(self.entries(), key=lambda x: x[1].st_mtime_ns)
+        self.size = sum(st.st_size for _, st in entries)
+        for path, st in entries:
+            if self.size <= self.max_size:
+                break
+            if path == keep or path in self.pins:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= st.st_size
+
+
+class Prefetch:
+    """ Fetch files with a pool of threads and keep track of the progress.
+
+    Iterating over a prefetch yields the path and the local path of each
+    file as soon as it was fetched, so the files can be worked on while
+    the rest is still being copied.
+    The local paths are released when the prefetch is closed,
+    which happens after iterating over all files or when leaving a with block.
+    """
+
+    def __init__(self, fetch, paths, workers=8, progress=True, release=None):
+        """
+        Parameters
+        ----------
+        fetch : callable
+            Called with a path, returns the local path and the number
+            of bytes transferred.
+        paths : list of str
+            Paths to fetch.
+        workers : int
+            Number of threads.
+        progress : bool or callable
+            Print the progress to stderr or call this with the prefetch
+            after each file.
+        release : callable
+            Called with each local path when the prefetch is closed,
+            e.g. to unpin the copy in the data cache.
+        """
+        import queue
+        import threading
+        self.fetch = fetch
+        self.paths = paths
+        self.workers = workers
+        self.progress = progress
+        # local paths of the fetched files and errors of the failed ones
+        self.local_paths = {}
+        self.errors = {}
+        # bytes transferred, files already in the cache do not count
+        self.bytes = 0
+        self.start_time = None
+        self.end_time = None
+        self.last_report = 0
+        self.finished = threading.Event()
+        self.results = queue.Queue()
+        self.release = release
+        self.closed = False
+
+    @property
+    def total(self):
+        return len(self.paths)
+
+    @property
+    def done(self):
+        return len(self.local_paths) + len(self.errors)
+
+    @property
+    def elapsed(self):
+        if self.start_time is None:
+            return 0
+        end = time.monotonic() if self.end_time is None else self.end_time
+        return end - self.start_time
+
+    @property
+    def rate(self):
+        """ Transferred bytes per second. """
+        elapsed = self.elapsed
+        return self.bytes / elapsed if elapsed > 0 else 0
+
+    def start(self):
+        """ Fetch the files in a background thread. """
+        import threading
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def run(self):
+        """ Fetch the files and return when all are done. """
+        from multiprocessing.pool import ThreadPool
+        self.start_time = time.monotonic()
+        try:
+            with ThreadPool(max(self.workers, 1)) as pool:
+                for path, local, size, error in pool.imap_unordered(
+                        self.fetch_one, self.paths):
+                    if error is None:
+                        self.local_paths[path] = local
+                        self.bytes += size
+                        self.results.put((path, local))
+                    else:
+                        self.errors[path] = error
+                    self.report()
+        finally:
+            self.end_time = time.monotonic()
+            self.finished.set()
+            self.results.put(None)
+            self.report(final=True)
+        return self
+
+    def fetch_one(self, path):
+        try:
+            local, size = self.fetch(path)
+            return path, local, size, None
+        except OSError as e:
+            return path, None, 0, e
+
+    def wait(self, timeout=None):
+        """ Wait until all files are fetched.
+
+        Returns
+        -------
+        bool
+            False if the timeout passed before.
+        """
+        return self.finished.wait(timeout)
+
+    def close(self):
+        """ Wait for the running fetches and release the local paths. """
+        self.wait()
+        if self.closed:
+            return
+        self.closed = True
+        if self.release is not None:
+            for local in self.local_paths.values():
+                self.release(local)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            item = self.results.get()
+            if item is None:
+                # for later iterations
+                self.results.put(None)
+                self.close()
+                return
+            yield item
+
+    def report(self, final=False):
+        if callable(self.progress):
+            self.progress(self)
+            return
+        if not self.progress:
+            return
+        now = time.monotonic()
+        if not final and now - self.last_report < 0.5:
+            return
+        self.last_report = now
+        print("\r{}/{} files, {:.1f} MB at {:.1f} MB/s".format(
+            self.done, self.total, self.bytes / 1e6, self.rate / 1e6),
+              end="\n" if final else "",
+              file=sys.stderr,
+              flush=True)
+
+
+def same_file_version(a, b):
+    return a.st_size == b.st_size and a.st_mtime_ns == b.st_mtime_ns
+
+
+# process wide instance
+shared_data_cache = None
+
+
+def data_cache():
+    """ Return the process wide data cache set up from the config. """
+    global shared_data_cache
+    conf = smurf.get_config()
+    cache_dir = conf.get("data_cache_dir")
+    if cache_dir is None:
+        cache_dir = os.path.join(smurf.config.home_path, "data_cache")
+    cache_dir = os.path.expanduser(cache_dir)
+    max_size = conf.get("data_cache_size")
+    if (shared_data_cache is None or shared_data_cache.cache_dir != cache_dir
+            or shared_data_cache.max_size != max_size):
+        shared_data_cache = DataCache(cache_dir, max_size)
+    return shared_data_cache
@@ -17,6 +17,11 @@ def main():
         os.makedirs(dot_dir)
     with open(os.path.join(dot_dir, "script_dir.txt"), "w") as of:
         of.write(package_dir)
+    # list the subcommands for the shell completion
+    # to not start python on every shell start
+    from smurf._command_line_ import available_scripts
+    with open(os.path.join(dot_dir, "subcommands.txt"), "w") as of:
+        of.write(" ".join(available_scripts()))
 
     # copy files
     shutil.copy2(plugin_file, dot_dir)
@@ -1,9 +1,16 @@
 # Obtain information about the simulation of the given path
 import os
 import sys
+import json
 
 meta_dir_names = ["meta", "job", ".sheep.d"]
 
+# fields stored in the meta dir
+info_fields = ["uuid", "name", "tags", "simcode", "note"]
+
+# name of the file in the meta dir holding all fields
+info_json_name = "info.json"
+
 
 def main():
     args = parse_command_line_args()
@@ -23,7 +30,7 @@ def main():
 
 def parse_command_line_args():
     import argparse
-    import argcomplete
+    from smurf._command_line_ import autocomplete
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "choice",
@@ -37,45 +44,103 @@ def parse_command_line_args():
         default=os.getcwd(),
         help="The path to start the search from. [default: current directory]."
     )
-    argcomplete.autocomplete(parser)
+    autocomplete(parser)
     args = parser.parse_args()
     return args
 
 
+def lazy_field(name):
+    """ Create a property which loads the field on first access. """
+
+    def getter(self):
+        if name not in self._fields:
+            self._fields[name] = self.load_field(name)
+        return self._fields[name]
+
+    def setter(self, value):
+        self._fields[name] = value
+
+    return property(getter, setter)
+
+
 class Info:
+    """ Meta information of a simulation.
+
+    The fields are only read from disk when they are first accessed.
+    If the meta dir contains an 'info.json' file, all fields are read
+    from it with a single open. Otherwise each field is read from its own file.
+    """
+    uuid = lazy_field("uuid")
+    name = lazy_field("name")
+    tags = lazy_field("tags")
+    simcode = lazy_field("simcode")
+    note = lazy_field("note")
+
     def __init__(self, path=None, create=False):
         if path is None:
             path = os.getcwd()
-        self.uuid = ""
-        self.name = ""
-        self.tags = []
-        self.simcode = ""
         self.path = ""
-        self.note = ""
+        self._fields = {}
+        self._meta_dir = None
+        self._info_json = None
         try:
-            self.path = find_simdir(path)
             self.load(path)
         except FileNotFoundError:
             if create:
                 self.path = path
+                self._fields = {"name": "", "tags": [], "simcode": "", "note": ""}
                 self.generate_uuid()
             else:
                 raise
 
     def load(self, path):
-        self.path = find_simdir(path)
-        for meta_dir in meta_dir_names:
-            if os.path.isdir(os.path.join(self.path, meta_dir)):
-                self.meta_dir = os.path.join(self.path, meta_dir)
-                break
-        self.uuid = self.get_uuid()
-        self.name = self.get_name()
-        self.tags = self.get_tags()
-        self.simcode = self.get_simcode()
-        self.path = self.get_path()
-        self.note = self.get_note()
+        self.path, uuid = locate_simdir(path)
+        self._fields = {"uuid": uuid}
+        self._meta_dir = None
+        self._info_json = None
+
+    @property
+    def meta_dir(self):
+        if self._meta_dir is None:
+            for meta_dir in meta_dir_names:
+                if os.path.isdir(os.path.join(self.path, meta_dir)):
+                    self._meta_dir = os.path.join(self.path, meta_dir)
+                    break
+            else:
+                raise AttributeError("No meta dir in '{}'".format(self.path))
+        return self._meta_dir
+
+    @meta_dir.setter
+    def meta_dir(self, value):
+        self._meta_dir = value
+
+    def load_field(self, name):
+        """ Read a field from info.json or from its own file. """
+        if self._info_json is None:
+            self._info_json = self.get_info_json()
+        try:
+            return self._info_json[name]
+        except KeyError:
+            return getattr(self, "get_" + name)()
+
+    def get_info_json(self):
+        try:
+            with open(os.path.join(self.meta_dir, info_json_name)) as infile:
+                return json.load(infile)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return {}
+
+    def save_info_json(self):
+        data = {k: getattr(self, k) for k in info_fields}
+        data["tags"] = sorted(data["tags"])
+        with open(os.path.join(self.meta_dir, info_json_name), "w") as outfile:
+            json.dump(data, outfile, indent=4)
 
     def save(self):
+        # read all fields from the current meta dir before
+        # switching to 'meta' and truncating the files
+        for name in info_fields:
+            getattr(self, name)
         self.meta_dir = os.path.join(self.path, "meta")
         os.makedirs(self.meta_dir, exist_ok=True)
         self.save_uuid()
@@ -83,6 +148,9 @@ class Info:
         self.save_tags()
         self.save_simcode()
         self.save_note()
+        if write_info_json() or os.path.exists(
+                os.path.join(self.meta_dir, info_json_name)):
+            self.save_info_json()
         print("uuid =", self.uuid)
         print("name =", self.name)
 
@@ -178,13 +246,23 @@ class Info:
         self.uuid = str(uuid.uuid4())
 
 
+def write_info_json():
+    """ Check whether the config asks for info.json to be written. """
+    from smurf.config import get_config
+    return get_config().get("info_json")
+
+
 def find_simdir(d):
+    return locate_simdir(d)[0]
+
+
+def locate_simdir(d):
+    """ Find the simdir containing d and its uuid. """
     start_d = d
     d = os.path.abspath(d)
     while d != "/":
         try:
-            get_uuid(d)
-            return os.path.abspath(d)
+            return d, get_uuid(d)
         except FileNotFoundError:
             pass
         d = os.path.dirname(d)
@@ -192,27 +270,55 @@ def find_simdir(d):
         "Could not find simdir starting at '{}'".format(start_d))
 
 
-def get_uuid(d):
+def get_uuid(d, names=None):
+    """ Get the uuid of the simdir d.
+
+    Each meta dir is listed once with os.scandir and only the uuid
+    entries actually present are read.
+
+    Parameters
+    ----------
+    d : str
+        Path of the directory.
+    names : collection of str
+        Names of the subdirectories of d if already known, e.g. from a directory walk.
+        Only meta dirs in names are checked then.
+
+    Returns
+    -------
+    str
+        The uuid.
+
+    Raises
+    ------
+    FileNotFoundError
+        If d is not a simdir.
+    """
     # check for all known meta dir names
     for meta_dir in meta_dir_names:
-        uuid_dir = os.path.join(d, meta_dir, "uuid")
-        uuid_file = os.path.join(d, meta_dir, "uuid.txt")
-        if os.path.exists(uuid_dir):
-            if os.path.isfile(uuid_dir):
-                return get_uuid_from_file(uuid_dir)
-            else:
-                try:
-                    return os.listdir(uuid_dir)[0]
-                except IndexError:
-                    pass
-        elif os.path.exists(uuid_file):
-            return get_uuid_from_file(uuid_file)
+        if names is not None and meta_dir not in names:
+            continue
+        try:
+            with os.scandir(os.path.join(d, meta_dir)) as it:
+                entries = {e.name: e for e in it if e.name.startswith("uuid")}
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        if "uuid" in entries:
+            entry = entries["uuid"]
+            try:
+                if entry.is_file():
+                    return get_uuid_from_file(entry.path)
+                return os.listdir(entry.path)[0]
+            except (IndexError, OSError):
+                pass
+        elif "uuid.txt" in entries:
+            return get_uuid_from_file(entries["uuid.txt"].path)
     raise FileNotFoundError
 
 
-def is_simdir(path):
+def is_simdir(path, names=None):
     try:
-        get_uuid(path)
+        get_uuid(path, names=names)
         return True
     except FileNotFoundError:
         return False
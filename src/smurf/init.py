@@ -26,7 +26,8 @@ def init(path):
 
 
 def parse_command_line_args():
-    import argparse, argcomplete
+    import argparse
+    from smurf._command_line_ import autocomplete
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "directory",
@@ -34,7 +35,7 @@ def parse_command_line_args():
         default=os.getcwd(),
         help="Directory to initialize simdir in. [default: current directory]."
     )
-    argcomplete.autocomplete(parser)
+    autocomplete(parser)
     args = parser.parse_args()
     return args
 
@@ -1,5 +1,6 @@
 # List the current directory and translate uuid directory names to the corresponding name saved inside the meta dir if existing.
 import os
+import sys
 from pathlib import Path
 
 from smurf.info import is_simdir, Info
@@ -8,11 +9,22 @@ maxlen = 8
 
 def main():
     args = parse_command_line_args()
+    if args.existing:
+        print_existing(sys.stdin)
+        return
     path = args.directory
 
     listdir(path, full_paths=args.f, print_tags=args.tags)
 
 
+def print_existing(lines):
+    """ Print the paths, one per line, which are directories. """
+    for line in lines:
+        path = line.rstrip("\n")
+        if os.path.isdir(path):
+            print(path)
+
+
 def listdir(path, full_paths=False, print_tags=False):
     path = Path(path)
     names = []
@@ -58,7 +70,7 @@ def listdir(path, full_paths=False, print_tags=False):
 
 def parse_command_line_args():
     import argparse
-    import argcomplete
+    from smurf._command_line_ import autocomplete
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "directory",
@@ -77,7 +89,12 @@ def parse_command_line_args():
         action="store_true",
         help="Print tags at end of line."
     )
-    argcomplete.autocomplete(parser)
+    parser.add_argument(
+        "--existing",
+        action="store_true",
+        help="Read paths from stdin and print those which are directories."
+    )
+    autocomplete(parser)
     args = parser.parse_args()
     return args
 
@@ -1,15 +1,27 @@
 from subprocess import run, PIPE
 import sys
-import time
 import os
+import json
 import atexit
 from tempfile import mkdtemp
 from pathlib import Path
-from .doublefork import detachify
 from uuid import uuid4
 
+import smurf.config
+
+# mounts of this process as provided by linux
+mountinfo_file = "/proc/self/mountinfo"
+
 
 class Mount:
+    """ A simulation directory, mounted with sshfs if it is on a remote host.
+
+    Remote mounts are owned by the mount manager process, which keeps them
+    mounted while any Mount object uses them. Call release() or use the
+    object as a context manager to give up the mount early, otherwise it
+    is released when the process exits.
+    """
+
     def __init__(self, remote, cache_timeout=None):
         if os.path.exists(remote):
             self._is_local = True
@@ -19,99 +31,379 @@ class Mount:
             self.remote = remote
             self.cache_timeout = cache_timeout
             self.mount_uuid = str(uuid4())
+            self._path = None
             self.mount()
 
-    def mount(self):
-        existing = find_existing_mount(self.remote)
-        if existing:
-            self.reuse_mount(existing.parent)
-        else:
-            self.create_mount()
-            self.create_unmounter()
-        self.flag_active()
-        self.flag_finished_on_exit()
-
-    def reuse_mount(self, path):
-        self.tempdir = path
-        self.flag_active()
-
-    def create_mount(self):
-        self.tempdir = Path(mkdtemp(prefix="smurf-"))
-        os.mkdir(self.tempdir / "active")
-        os.mkdir(self.get_path())
-        mount_sshfs(self.remote,
-                    self.get_path(),
-                    cache_timeout=self.cache_timeout)
-
-    def flag_active(self):
-        """ Flag the mount point to be in use. """
-        self.get_active_flag_file().touch()
-
-    def get_active_flag_file(self):
-        return self.tempdir / "active" / self.mount_uuid
-
-    def flag_finished(self):
-        """ Flag the mount point to be in not in use anymore. """
-        self.get_finished_flag_file().touch()
-        os.remove(self.get_active_flag_file())
-
-    def time_since_finished(self):
-        """ Return the time since the finished flag file was last touched """
-        if self.get_finished_flag_file().exists():
-            return time.time() - self.get_finished_flag_file().stat().st_ctime
-        else:
-            return -1
-
-    def in_use(self):
-        """ Check whether there are still users of the mount point """
-        return len(os.listdir(self.tempdir / "active")) > 0
+    def __enter__(self):
+        return self
 
-    def get_finished_flag_file(self):
-        return Path(self.tempdir) / "finished"
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
 
-    def flag_finished_on_exit(self):
-        atexit.register(lambda: self.flag_finished())
-
-    def create_unmounter(self):
-        """ Spawn a detached process to unmount the sshfs after a certain period. """
-        atexit.register(lambda: unmount_delayed(self))
+    def mount(self):
+        from smurf.mount_manager import acquire
+        self._path = acquire(self.remote,
+                             self.mount_uuid,
+                             cache_timeout=self.cache_timeout)
+        atexit.register(self.release)
+
+    def release(self):
+        """ Tell the mount manager that the mount is not used anymore. """
+        if self._is_local or self._path is None:
+            return
+        from smurf.mount_manager import release
+        release(self.remote, self.mount_uuid)
+        self._path = None
+        atexit.unregister(self.release)
 
     def get_path(self):
         """ Return the path of the mount point """
+        if not self._is_local and self._path is None:
+            raise RuntimeError("Mount of {} was released".format(self.remote))
+        return self._path
+
+    def local_path(self, path):
+        """ Return a path on the local disk to read a file from.
+
+        Files of remote simulations are copied into the data cache
+        unless an up to date copy is there already.
+
+        Parameters
+        ----------
+        path : str
+            Path of the file relative to the simulation directory.
+        """
+        return self.fetch_file(path)[0]
+
+    def fetch_file(self, path, pin=False):
+        """ Copy a file into the data cache if needed.
+
+        Parameters
+        ----------
+        path : str
+            Path of the file relative to the simulation directory.
+        pin : bool
+            Keep the copy from being evicted until it is unpinned in the data cache.
+
+        Returns
+        -------
+        (str, int)
+            The local path and the number of bytes transferred.
+        """
+        source = os.path.join(self.get_path(), path)
         if self._is_local:
-            return self._path
-        else:
-            return os.path.join(self.tempdir, "mnt")
-
-    def unmount(self):
-        """ Unmount and remove temporary directories """
-        unmount_sshfs(self.get_path())
-        os.rmdir(self.get_path())
-        os.rmdir(self.tempdir / "active")
-        os.remove(self.get_finished_flag_file())
-        os.rmdir(self.tempdir)
+            return source, 0
+        from smurf.datacache import data_cache
+        host, remote_dir = self.remote.split(":", 1)
+        remote_path = os.path.normpath(os.path.join(remote_dir, path))
+        cache = data_cache()
+        st = os.stat(source)
+        cached = cache.get(host, remote_path, st, pin=pin)
+        if cached is not None:
+            return cached, 0
+        return cache.fetch(host, remote_path, source, pin=pin), st.st_size
+
+    def prefetch(self, globs, workers=8, background=False, progress=True):
+        """ Copy files into the data cache using parallel readers.
+
+        Parameters
+        ----------
+        globs : str or list of str
+            Glob patterns of the files relative to the simulation directory,
+            '**' matches any number of subdirectories.
+        workers : int
+            Number of files copied at the same time.
+        background : bool
+            Return right away and copy the files in a background thread.
+        progress : bool or callable
+            Print the progress and transfer rate to stderr
+            or call this with the prefetch after each file.
+
+        Returns
+        -------
+        smurf.datacache.Prefetch
+            Tells the progress. Iterate over it to get the paths
+            and local paths of the files as soon as they are copied.
+            The copies are not evicted before it is closed.
+        """
+        import glob
+        from functools import partial
+        from smurf.datacache import Prefetch, data_cache
+        if isinstance(globs, str):
+            globs = [globs]
+        base = self.get_path()
+        paths = set()
+        for pattern in globs:
+            for p in glob.glob(os.path.join(base, pattern), recursive=True):
+                if os.path.isfile(p):
+                    paths.add(os.path.relpath(p, base))
+        release = None if self._is_local else data_cache().unpin
+        prefetch = Prefetch(partial(self.fetch_file, pin=True),
+                            sorted(paths),
+                            workers=workers,
+                            progress=progress,
+                            release=release)
+        if background:
+            return prefetch.start()
+        return prefetch.run()
+
+    def open(self, path, mode="r", **kwargs):
+        """ Open a file for reading from its copy in the data cache.
+
+        Parameters
+        ----------
+        path : str
+            Path of the file relative to the simulation directory.
+        mode : str
+            Mode as for the builtin open, only reading is allowed.
+        """
+        if any(c in mode for c in "wax+"):
+            raise ValueError("Files of a mount can only be opened for reading")
+        local, _ = self.fetch_file(path, pin=True)
+        try:
+            # an open copy can be evicted without disturbing the reader
+            return open(local, mode, **kwargs)
+        finally:
+            if not self._is_local:
+                from smurf.datacache import data_cache
+                data_cache().unpin(local)
+
+
+def create_mount(remote, cache_timeout=None):
+    """ Mount a remote location in a new temp dir.
+
+    Returns
+    -------
+    str
+        Path of the mount point.
+
+    Raises
+    ------
+    OSError
+        If sshfs failed.
+    """
+    tempdir = mkdtemp(prefix="smurf-")
+    mountpoint = os.path.join(tempdir, "mnt")
+    os.mkdir(mountpoint)
+    try:
+        mount_sshfs(remote, mountpoint, cache_timeout=cache_timeout)
+    except OSError:
+        os.rmdir(mountpoint)
+        os.rmdir(tempdir)
+        raise
+    return mountpoint
+
+
+def remove_mount(remote, mountpoint):
+    """ Unmount a registered mount created by smurf and remove its temp dir.
+
+    Returns
+    -------
+    bool
+        False if the location could not be unmounted.
+    """
+    if not discard_mount(mountpoint):
+        return False
+    MountRegistry().remove(remote)
+    return True
+
+
+def discard_mount(mountpoint):
+    """ Unmount a mount created by smurf and remove its temp dir.
+
+    Returns
+    -------
+    bool
+        False if the location could not be unmounted.
+    """
+    import shutil
+    unmount_sshfs(mountpoint)
+    try:
+        # fails if it is still mounted
+        os.rmdir(mountpoint)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return False
+    if is_smurf_mountpoint(mountpoint):
+        # also removes the flag files of mounts made by older versions
+        shutil.rmtree(os.path.dirname(mountpoint), ignore_errors=True)
+    return True
 
 
 def mount_sshfs(remote, local, cache_timeout=None):
     # mount a remote location to a local directory using sshfs
+    # over a shared ssh connection to the host
+    from smurf.ssh import ensure_master, host_of, ssh_options
     if cache_timeout is None:
         cache_timeout = 900
     timeout = str(cache_timeout)
-    run([
-        "sshfs", "-o", "ro", "-o", "kernel_cache", "-o", "cache=yes", "-o",
+    host = host_of(remote)
+    if host is not None and ensure_master(host):
+        ssh_opts = ssh_options(master="no")
+    else:
+        ssh_opts = []
+    res = run(["sshfs"] + ssh_opts + [
+        "-o", "ro", "-o", "kernel_cache", "-o", "cache=yes", "-o",
         "cache_timeout=" + timeout, "-o", "cache_stat_timeout=" + timeout,
         "-o", "cache_dir_timeout=" + timeout, "-o",
         "cache_link_timeout=" + timeout, "-o", "entry_timeout=" + timeout,
         "-o", "attr_timeout=" + timeout, "-o", "ac_attr_timeout=" + timeout,
         remote, local
     ])
-
-
-def find_existing_mount(path):
-    res = run(["mount"], stdout=PIPE, encoding="utf-8").stdout.splitlines()
-    for line in res:
-        if path in line and line.split()[2][:4] == "/tmp":
-            return Path(line.split()[2])
+    if res.returncode != 0:
+        raise OSError("sshfs exited with code {}".format(res.returncode))
+
+
+def find_existing_mount(path, mounts=None):
+    """ Find a sshfs mount of a remote location created by smurf.
+
+    Parameters
+    ----------
+    path : str
+        Remote location, e.g. 'host:/path/to/simdir'.
+    mounts : list of (str, str, str)
+        Current mounts as returned by current_mounts.
+
+    Returns
+    -------
+    pathlib.Path
+        The mount point or None if the location is not mounted.
+    """
+    if mounts is None:
+        mounts = current_mounts()
+    active = set((source, mountpoint) for source, mountpoint, _ in mounts)
+    registry = MountRegistry()
+    mountpoint = registry.data.get(path)
+    if mountpoint is not None:
+        if (path, mountpoint) in active:
+            return Path(mountpoint)
+        registry.remove(path)
+    # mounts created before the registry existed
+    for source, mountpoint, fstype in mounts:
+        if source == path and is_smurf_mountpoint(mountpoint):
+            registry.add(path, mountpoint)
+            return Path(mountpoint)
+
+
+def is_smurf_mountpoint(path):
+    """ Check whether path is a mount point inside a temp dir of smurf. """
+    tempdir, name = os.path.split(path)
+    return name == "mnt" and os.path.basename(tempdir).startswith("smurf-")
+
+
+class MountRegistry:
+    """ Mount points of the sshfs mounts created by smurf.
+
+    Maps the remote location to the local mount point.
+    Entries are checked against the current mounts before they are used.
+    """
+
+    def __init__(self, registry_file=None):
+        if registry_file is None:
+            registry_file = os.path.join(smurf.config.home_path, "mounts.json")
+        self.registry_file = registry_file
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.registry_file, "r") as infile:
+                self.data = json.load(infile)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            self.data = {}
+
+    def save(self):
+        from smurf.cache import atomic_write
+        with atomic_write(self.registry_file) as outfile:
+            outfile.write(json.dumps(self.data))
+
+    def add(self, remote, mountpoint):
+        self.update(remote, str(mountpoint))
+
+    def remove(self, remote):
+        self.update(remote, None)
+
+    def update(self, remote, mountpoint):
+        """ Set or remove an entry while other processes are locked out. """
+        from smurf.cache import locked
+        os.makedirs(os.path.dirname(self.registry_file), exist_ok=True)
+        with locked(self.registry_file):
+            self.load()
+            if mountpoint is None:
+                self.data.pop(remote, None)
+            else:
+                self.data[remote] = mountpoint
+            self.save()
+
+
+def current_mounts(mountinfo=None):
+    """ List the mounted filesystems.
+
+    They are read from /proc/self/mountinfo and from the output
+    of the mount command on systems without it.
+
+    Parameters
+    ----------
+    mountinfo : str
+        Path of the mountinfo file.
+
+    Returns
+    -------
+    list of (str, str, str)
+        Source, mount point and type of each mount.
+    """
+    try:
+        with open(mountinfo_file if mountinfo is None else mountinfo,
+                  "r") as infile:
+            return parse_mountinfo(infile.read())
+    except OSError:
+        res = run(["mount"], stdout=PIPE, universal_newlines=True)
+        return parse_mount_output(res.stdout)
+
+
+def parse_mountinfo(text):
+    """ Parse the content of a mountinfo file, see proc(5). """
+    rv = []
+    for line in text.splitlines():
+        fields = line.split()
+        try:
+            # optional fields end with a single '-'
+            sep = fields.index("-", 6)
+            rv.append((unescape_mountinfo(fields[sep + 2]),
+                       unescape_mountinfo(fields[4]), fields[sep + 1]))
+        except (ValueError, IndexError):
+            continue
+    return rv
+
+
+def unescape_mountinfo(s):
+    """ Replace the octal escapes of spaces and other special characters. """
+    if "\\" not in s:
+        return s
+    import re
+    return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), s)
+
+
+def parse_mount_output(text):
+    """ Parse the output of the mount command on linux and macos.
+
+    Lines look like 'source on mountpoint type fstype (options)'
+    or 'source on mountpoint (fstype, options)'.
+    """
+    rv = []
+    for line in text.splitlines():
+        try:
+            source, rest = line.split(" on ", 1)
+            if " type " in rest:
+                mountpoint, rest = rest.rsplit(" type ", 1)
+                fstype = rest.split()[0]
+            else:
+                mountpoint, rest = rest.rsplit(" (", 1)
+                fstype = rest.split(",")[0].rstrip(")")
+        except (ValueError, IndexError):
+            continue
+        rv.append((source, mountpoint, fstype))
+    return rv
 
 
 def unmount_sshfs(local):
@@ -122,40 +414,25 @@ def unmount_sshfs(local):
         run(["fusermount", "-u", local])
 
 
-@detachify
-def unmount_delayed(mount, waiting_time=None):
-    """ unmount after some time if not still in use """
-    time.sleep(1)
-    if waiting_time is None:
-        waiting_time = 120
-    # check whether path is still mounted
-    for n in range(1000):
-        if not mount.in_use() and mount.time_since_finished() > waiting_time:
-            mount.unmount()
-            return
-        else:
-            time.sleep(waiting_time)
-
-
 def sshfs_mounts():
-    res = run(["mount"], stdout=PIPE, encoding="utf-8").stdout.splitlines()
+    """ Return the source and mount point of the sshfs mounts of smurf. """
     mounts = []
-    for line in res:
-        if all([s in line for s in ["smurf", "sshfs"]]):
-            mounts.append(line)
+    for source, mountpoint, fstype in current_mounts():
+        if "smurf" in mountpoint and ("sshfs" in fstype or "sshfs" in source):
+            mounts.append((source, mountpoint))
     return mounts
 
 
-def remount(line):
-    remote = line.split()[0]
-    local = line.split()[2]
+def remount(mount):
+    remote, local = mount
     unmount_sshfs(local)
     mount_sshfs(remote, local)
 
 
-def unmount(line):
-    local = line.split()[2]
+def unmount(mount):
+    remote, local = mount
     unmount_sshfs(local)
+    MountRegistry().remove(remote)
 
 
 def main():
@@ -174,8 +451,8 @@ def main():
     elif args.unmount is not None:
         unmount(mounts[args.unmount])
     else:
-        for n, line in enumerate(mounts):
-            print(f"{n} : {line}")
+        for n, (remote, local) in enumerate(mounts):
+            print(f"{n} : {remote} on {local}")
 
 
 if __name__ == "__main__":
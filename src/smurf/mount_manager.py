@@ -0,0 +1,326 @@
+""" Process which owns the sshfs mounts of smurf.
+
+Mount objects ask the manager for a remote location over a unix socket
+in the smurf home dir and release it when they are done. If a location
+is not mounted yet, the asking process mounts it itself, so ssh can ask
+for passwords on its terminal and uses its ssh agent, and hands it over.
+The manager counts the references to each mount and unmounts it
+once it was not used for 'mount_idle_timeout' seconds.
+References of processes which exited without releasing them are dropped.
+The manager is started on demand and exits when nothing is mounted.
+"""
+import os
+import time
+import heapq
+
+import smurf
+import smurf.config
+from smurf.daemon import SocketWriter, receive_all, query, request_timeout
+
+# seconds between checks whether the processes holding references still exist
+check_interval = 60
+
+# shortest time to wait for requests in seconds
+min_wakeup = 0.01
+
+
+def socket_path():
+    return os.path.join(smurf.config.home_path, "mounts.sock")
+
+
+def acquire(remote, client, cache_timeout=None):
+    """ Get the mount point of a remote location, mounting it if needed.
+
+    The manager is started if it is not running.
+
+    Parameters
+    ----------
+    remote : str
+        Remote location, e.g. 'host:/path/to/simdir'.
+    client : str
+        Id of the reference, used to release it.
+    cache_timeout : int
+        Cache timeout of sshfs in seconds.
+
+    Returns
+    -------
+    str
+        Path of the mount point.
+    """
+    request = {"acquire": remote, "client": client, "pid": os.getpid()}
+    rv = query(request, path=socket_path())
+    if rv is None:
+        start()
+        rv = query(request, path=socket_path())
+    check_answer(rv, remote)
+    if rv["path"] is not None:
+        return rv["path"]
+    from smurf.mount import create_mount, discard_mount
+    mountpoint = create_mount(remote, cache_timeout=cache_timeout)
+    request["mountpoint"] = mountpoint
+    rv = query(request, path=socket_path())
+    try:
+        check_answer(rv, remote)
+    except (RuntimeError, OSError):
+        discard_mount(mountpoint)
+        raise
+    if rv["path"] != mountpoint:
+        # another process mounted the location in the meantime
+        discard_mount(mountpoint)
+    return rv["path"]
+
+
+def check_answer(rv, remote):
+    if rv is None:
+        raise RuntimeError("Could not reach the smurf mount manager")
+    if rv["code"] != 0:
+        raise OSError("Could not mount {}: {}".format(remote, rv["error"]))
+
+
+def release(remote, client):
+    """ Release a reference to a mount obtained with acquire. """
+    query({"release": remote, "client": client}, path=socket_path())
+
+
+def start():
+    """ Start the manager in a new interpreter and wait until it answers.
+
+    A fresh process is used instead of a fork, so the manager
+    does not keep a copy of the memory of the calling process.
+    """
+    import sys
+    from subprocess import Popen, DEVNULL
+    env = dict(os.environ)
+    # make the package importable if it is not installed
+    package_parent = os.path.dirname(os.path.dirname(smurf.__file__))
+    env["PYTHONPATH"] = os.pathsep.join(
+        [package_parent] +
+        ([env["PYTHONPATH"]] if "PYTHONPATH" in env else []))
+    Popen([sys.executable, "-m", "smurf.mount_manager"],
+          stdin=DEVNULL,
+          stdout=DEVNULL,
+          stderr=DEVNULL,
+          cwd="/",
+          env=env,
+          start_new_session=True)
+    for n in range(50):
+        if query({"ping": True}, path=socket_path()) is not None:
+            return
+        time.sleep(0.1)
+
+
+def serve(path=None, idle_timeout=None):
+    """ Answer requests until no mount is left.
+
+    Parameters
+    ----------
+    path : str
+        Path of the socket. Defaults to mounts.sock in the smurf home dir.
+    idle_timeout : float
+        Seconds after which an unused mount is unmounted.
+        Defaults to 'mount_idle_timeout' of the config.
+    """
+    import socket
+    path = socket_path() if path is None else path
+    if idle_timeout is None:
+        idle_timeout = smurf.get_config().get("mount_idle_timeout")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        if query({"ping": True}, path=path) is not None:
+            raise RuntimeError("smurf mount manager is already running")
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o077)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(old_umask)
+    server.listen()
+    manager = MountManager(idle_timeout)
+    try:
+        while True:
+            server.settimeout(manager.next_wakeup())
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                conn = None
+            if conn is not None:
+                # a client which does not send its request must not block the others
+                conn.settimeout(request_timeout)
+                with conn:
+                    try:
+                        running = manager.handle(conn)
+                    except Exception as e:
+                        # a broken request must not take the mounts down
+                        SocketWriter(conn, "stdout").send({
+                            "code": 1,
+                            "error": str(e)
+                        })
+                        running = True
+                    if not running:
+                        break
+            manager.expire()
+            if manager.finished():
+                break
+    finally:
+        server.close()
+        os.remove(path)
+        manager.unmount_all()
+
+
+class MountManager:
+    """ Reference counts and unmount timers of the mounts.
+
+    Each mount maps to a dict with its mount point, the references
+    as a dict of client ids to process ids and its unmount deadline.
+    Unmount deadlines are kept in a heap, so the manager sleeps
+    until the next one is due no matter how many mounts there are.
+    """
+
+    def __init__(self, idle_timeout):
+        self.idle_timeout = idle_timeout
+        self.mounts = {}
+        # (deadline, remote) of mounts without references,
+        # entries not matching the deadline of the mount are stale
+        self.timers = []
+        self.last_check = time.monotonic()
+        self.last_request = time.monotonic()
+
+    def handle(self, conn):
+        """ Answer a single request.
+
+        Returns
+        -------
+        bool
+            False if the manager should shut down.
+        """
+        import json
+        self.last_request = time.monotonic()
+        request = json.loads(receive_all(conn))
+        out = SocketWriter(conn, "stdout")
+        if "shutdown" in request:
+            out.send({"code": 0})
+            return False
+        if "ping" in request:
+            out.send({"code": 0, "pid": os.getpid()})
+        elif "acquire" in request:
+            try:
+                mountpoint = self.acquire(request["acquire"],
+                                          request["client"], request["pid"],
+                                          request.get("mountpoint"))
+                out.send({"code": 0, "path": mountpoint})
+            except OSError as e:
+                out.send({"code": 1, "error": str(e)})
+        elif "release" in request:
+            self.release(request["release"], request["client"])
+            out.send({"code": 0})
+        elif "list" in request:
+            out.send({
+                "code": 0,
+                "mounts": {
+                    remote: [m["mountpoint"], len(m["refs"])]
+                    for remote, m in self.mounts.items()
+                }
+            })
+        return True
+
+    def acquire(self, remote, client, pid, mountpoint=None):
+        """ Add a reference to a mount and return its mount point.
+
+        Parameters
+        ----------
+        mountpoint : str
+            Mount point of the location mounted by the client.
+            Ignored if the location is mounted already.
+
+        Returns
+        -------
+        str
+            The mount point or None if the location is not mounted
+            and the client should mount it.
+        """
+        from smurf.mount import find_existing_mount, MountRegistry
+        m = self.mounts.get(remote)
+        if m is None:
+            if mountpoint is not None:
+                MountRegistry().add(remote, mountpoint)
+            else:
+                existing = find_existing_mount(remote)
+                if existing is None:
+                    return None
+                mountpoint = str(existing)
+            m = {"mountpoint": mountpoint, "refs": {}, "deadline": None}
+            self.mounts[remote] = m
+        m["refs"][client] = pid
+        m["deadline"] = None
+        return m["mountpoint"]
+
+    def release(self, remote, client):
+        m = self.mounts.get(remote)
+        if m is None or client not in m["refs"]:
+            return
+        del m["refs"][client]
+        if len(m["refs"]) == 0:
+            self.set_timer(remote, m)
+
+    def set_timer(self, remote, m):
+        m["deadline"] = time.monotonic() + self.idle_timeout
+        heapq.heappush(self.timers, (m["deadline"], remote))
+
+    def next_wakeup(self):
+        """ Seconds until the next timer is due or the next check of the clients. """
+        now = time.monotonic()
+        wakeup = self.last_check + check_interval
+        if len(self.timers) > 0:
+            wakeup = min(wakeup, self.timers[0][0])
+        if len(self.mounts) == 0:
+            wakeup = min(wakeup, self.last_request + self.idle_timeout)
+        # a timeout of 0 would make the socket non-blocking
+        return max(wakeup - now, min_wakeup)
+
+    def finished(self):
+        """ Check whether nothing is mounted and no requests came in for a while. """
+        return (len(self.mounts) == 0 and
+                time.monotonic() - self.last_request >= self.idle_timeout)
+
+    def expire(self):
+        """ Drop references of exited processes and unmount idle mounts. """
+        from smurf.mount import remove_mount
+        now = time.monotonic()
+        if now - self.last_check >= check_interval:
+            self.last_check = now
+            for remote, m in list(self.mounts.items()):
+                for client, pid in list(m["refs"].items()):
+                    if not process_exists(pid):
+                        self.release(remote, client)
+        while len(self.timers) > 0 and self.timers[0][0] <= now:
+            deadline, remote = heapq.heappop(self.timers)
+            m = self.mounts.get(remote)
+            # the mount might have been used again since the timer was set
+            if m is None or m["deadline"] != deadline:
+                continue
+            if remove_mount(remote, m["mountpoint"]):
+                del self.mounts[remote]
+            else:
+                self.set_timer(remote, m)
+
+    def unmount_all(self):
+        """ Unmount everything which is not in use anymore. """
+        from smurf.mount import remove_mount
+        for remote, m in list(self.mounts.items()):
+            if len(m["refs"]) == 0 and remove_mount(remote, m["mountpoint"]):
+                del self.mounts[remote]
+
+
+def process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+if __name__ == "__main__":
+    serve()
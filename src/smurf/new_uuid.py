@@ -24,14 +24,14 @@ def new_uuid(path):
 
 def parse_command_line_args():
     import argparse
-    import argcomplete
+    from smurf._command_line_ import autocomplete
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "directory",
         nargs="?",
         default=os.getcwd(),
         help="Directory to give a new uuid to. [default: current directory].")
-    argcomplete.autocomplete(parser)
+    autocomplete(parser)
     args = parser.parse_args()
     return args
 
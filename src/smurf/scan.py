@@ -0,0 +1,231 @@
+""" Walk directory trees to find simdirs. """
+import os
+import json
+from fnmatch import fnmatch
+
+import smurf.info as siminfo
+
+# entries of a meta dir whose content ends up in the cache entry,
+# files can be edited in place without changing the mtime of the meta dir
+meta_entries = ["uuid", "uuid.txt", "name.txt", "tags.txt", "simcode.txt",
+                siminfo.info_json_name]
+
+
+class ScanState:
+    """ Directory info recorded during the last walk.
+
+    Maps the absolute path of each visited directory to a dict with its
+    mtime, inode, subdirectories, meta dirs and simdir detection result.
+    """
+
+    def __init__(self, state_file):
+        self.state_file = state_file
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.state_file, "r") as infile:
+                self.data = json.load(infile)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            self.data = {}
+
+    def save(self):
+        with open(self.state_file, "w") as outfile:
+            outfile.write(json.dumps(self.data))
+
+    def replace_trees(self, bases, entries):
+        """ Replace all entries below the base dirs by new ones. """
+        bases = [os.path.abspath(b) for b in bases]
+        prefixes = tuple(os.path.join(b, "") for b in bases)
+        self.data = {
+            k: v
+            for k, v in self.data.items()
+            if k not in bases and not k.startswith(prefixes)
+        }
+        self.data.update(entries)
+
+
+def find_simdirs(base,
+                 state=None,
+                 new_state=None,
+                 nested=False,
+                 exclude=None,
+                 max_depth=None,
+                 frontier=None):
+    """ Walk the directory tree below base and yield simdirs.
+
+    Parameters
+    ----------
+    base : str
+        Directory to start from.
+    state : dict
+        Directory info of the last walk.
+        Directories with unchanged mtime, inode and meta files are not listed
+        again and their simdir detection result is reused.
+    new_state : dict
+        Gets filled with the directory info of this walk.
+    nested : bool
+        Also look for simdirs inside of simdirs.
+    exclude : list of str
+        Glob patterns of directories not to descend into.
+        Patterns are matched against the directory name
+        or, if they contain a '/', against the full path.
+    max_depth : int
+        Only walk this many levels below base.
+    frontier : list
+        Gets filled with the directories below max_depth which were not walked.
+
+    Yields
+    ------
+    (str, bool)
+        Path of the simdir and whether it changed since the last walk.
+    """
+    if state is None:
+        state = {}
+    exclude = [] if exclude is None else [p.rstrip("/") for p in exclude]
+    stack = [(os.path.abspath(base), 0)]
+    while len(stack) > 0:
+        d, depth = stack.pop()
+        if max_depth is not None and depth > max_depth:
+            if frontier is not None:
+                frontier.append(d)
+            continue
+        try:
+            st = os.stat(d)
+            entry = state.get(d)
+            if is_unchanged(d, st, entry):
+                changed = False
+            else:
+                entry = scan_dir(d, st)
+                changed = True
+        except OSError:
+            continue
+        if new_state is not None:
+            new_state[d] = entry
+        if entry["simdir"]:
+            yield d, changed
+            if not nested:
+                continue
+        for name in reversed(entry["subdirs"]):
+            path = os.path.join(d, name)
+            if not is_excluded(path, name, exclude):
+                stack.append((path, depth + 1))
+
+
+def find_simdirs_parallel(bases,
+                          jobs,
+                          state=None,
+                          new_state=None,
+                          nested=False,
+                          exclude=None,
+                          split_depth=1):
+    """ Find simdirs in several base dirs using a pool of threads.
+
+    The top levels of each base are walked directly.
+    The subtrees below split_depth are walked in parallel,
+    so rootdirs on different filesystems and large subtrees
+    are scanned at the same time.
+
+    Parameters
+    ----------
+    bases : list of str
+        Directories to start from.
+    jobs : int
+        Number of threads.
+    split_depth : int
+        Depth below the bases at which the tree is split into tasks.
+
+    See find_simdirs for the other parameters.
+
+    Returns
+    -------
+    list of (str, bool)
+        Paths of the simdirs and whether they changed since the last walk.
+    """
+    from multiprocessing.pool import ThreadPool
+    rv = []
+    frontier = []
+    for base in bases:
+        rv += find_simdirs(base,
+                           state,
+                           new_state,
+                           nested=nested,
+                           exclude=exclude,
+                           max_depth=split_depth,
+                           frontier=frontier)
+
+    def walk(d):
+        walked = {}
+        found = list(
+            find_simdirs(d, state, walked, nested=nested, exclude=exclude))
+        return found, walked
+
+    with ThreadPool(jobs) as p:
+        for found, walked in p.imap(walk, frontier):
+            rv += found
+            if new_state is not None:
+                new_state.update(walked)
+    return rv
+
+
+def is_excluded(path, name, patterns):
+    """ Check whether a directory matches any of the exclude patterns. """
+    for p in patterns:
+        if fnmatch(path if "/" in p else name, p):
+            return True
+    return False
+
+
+def is_unchanged(d, st, entry):
+    """ Check whether a directory is the same as recorded in entry.
+
+    Entries of older versions without 'meta_dirs' count as changed.
+    """
+    return (entry is not None and "meta_dirs" in entry
+            and entry["mtime"] == st.st_mtime_ns and entry["ino"] == st.st_ino
+            and entry["meta"] == meta_signature(d, entry["meta_dirs"]))
+
+
+def scan_dir(d, st):
+    """ List subdirectories and detect whether d is a simdir.
+
+    The listing is reused for the simdir detection,
+    so only meta dirs which are present are looked into.
+    Symlinks are not walked into, but meta dirs may be symlinks.
+    """
+    subdirs = []
+    meta_dirs = []
+    with os.scandir(d) as it:
+        for e in it:
+            if e.is_dir(follow_symlinks=False):
+                subdirs.append(e.name)
+            if e.name in siminfo.meta_dir_names and e.is_dir():
+                meta_dirs.append(e.name)
+    subdirs.sort()
+    return {
+        "mtime": st.st_mtime_ns,
+        "ino": st.st_ino,
+        "subdirs": subdirs,
+        "meta_dirs": meta_dirs,
+        "simdir": siminfo.is_simdir(d, names=meta_dirs),
+        "meta": meta_signature(d, meta_dirs)
+    }
+
+
+def meta_signature(d, meta_dirs):
+    """ Modification times of the meta dirs in d and the files describing the simulation.
+
+    The uuid, name or tags of a simdir change without touching the simdir itself,
+    so these need to be checked separately.
+    """
+    rv = []
+    for name in siminfo.meta_dir_names:
+        if name not in meta_dirs:
+            continue
+        meta_dir = os.path.join(d, name)
+        for p in [meta_dir] + [os.path.join(meta_dir, e) for e in meta_entries]:
+            try:
+                rv.append(os.stat(p).st_mtime_ns)
+            except FileNotFoundError:
+                rv.append(None)
+    return rv
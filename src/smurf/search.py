@@ -1,42 +1,103 @@
 import json
-import subprocess
 import sys
 import os
 
 import smurf
 import smurf.cache as cache
 
-# timeout after which to cancel search if host does not respond
-search_timeout = 10
-
 
 def main():
     args = parse_command_line_args()
 
-    rv = search(args.patterns,
-                unique=args.unique,
-                exclusive=args.exclusive_search,
-                remote=not args.local,
-                force_global=args.g,
-                ensure_exist=args.validate)
+    printer = ResultPrinter(json_output=args.json, attribute=args.print)
+    try:
+        rv = search(args.patterns,
+                    unique=args.unique,
+                    exclusive=args.exclusive_search,
+                    remote=not args.local,
+                    force_global=args.g,
+                    ensure_exist=args.validate,
+                    on_result=None if args.unique else printer.print)
+        printer.finish(rv)
+    finally:
+        printer.close()
+    for host, reason in getattr(rv, "failed_hosts", {}).items():
+        print("Warning: no results from {}: {}".format(host, reason),
+              file=sys.stderr)
+
+
+class ResultPrinter:
+    """ Print search results as they arrive.
+
+    Results from hosts which answer a global search early are printed
+    while waiting for the others. Tables are only printed at the end,
+    because their column widths and order depend on all results.
+    """
 
-    if args.json:
-        print(json.dumps(rv, indent=4))
-    elif args.print:
-        for sim in rv:
-            if args.print == "location":
-                print(remote_path(sim))
+    def __init__(self, json_output=False, attribute=None):
+        """
+        Parameters
+        ----------
+        json_output : bool
+            Print a json list.
+        attribute : str
+            Only print this property of each simulation.
+        """
+        self.json_output = json_output
+        self.attribute = attribute
+        self.printed = set()
+        self.closed = False
+
+    @property
+    def streamed(self):
+        return self.json_output or self.attribute is not None
+
+    def print(self, sims):
+        """ Print the simulations which were not printed yet. """
+        if not self.streamed:
+            return
+        sims = [s for s in sims if id(s) not in self.printed]
+        if self.json_output:
+            import textwrap
+            # write the same output as json.dumps(list, indent=4) piece by piece
+            for sim in sims:
+                sys.stdout.write("[\n" if len(self.printed) == 0 else ",\n")
+                sys.stdout.write(
+                    textwrap.indent(json.dumps(sim, indent=4), " " * 4))
+                self.printed.add(id(sim))
+        else:
+            self.printed.update(id(s) for s in sims)
+            if self.attribute == "location":
+                for sim in sims:
+                    print(remote_path(sim))
             else:
-                print(sim[args.print])
-    else:
-        print_table(rv)
+                for sim in sims:
+                    print(sim[self.attribute])
+        sys.stdout.flush()
+
+    def finish(self, sims):
+        """ Print the remaining simulations and close the output. """
+        if not self.streamed:
+            print_table(sims)
+            return
+        self.print(sims)
+        if self.json_output and len(self.printed) == 0:
+            print("[]")
+        self.close()
+
+    def close(self):
+        """ End the json list if it was started, e.g. when the search failed. """
+        if self.json_output and len(self.printed) > 0 and not self.closed:
+            print("\n]")
+            self.closed = True
 
 
 def parse_command_line_args():
     import argparse
-    import argcomplete
+    from smurf._command_line_ import autocomplete
     parser = argparse.ArgumentParser()
-    parser.add_argument("patterns", nargs="+", help="What to search for.")
+    parser.add_argument("patterns", nargs="+",
+                        help="What to search for.").completer = sim_completer
     parser.add_argument("-v", "--verbose", default=False, action="store_true")
     parser.add_argument("-g",
                         default=False,
@@ -74,11 +135,22 @@ def parse_command_line_args():
                         default=False,
                         action="store_true",
                         help="Check that simulation exists on host and delete from cache if not.")
-    argcomplete.autocomplete(parser)
+    autocomplete(parser)
     args = parser.parse_args()
     return args
 
 
+def sim_completer(prefix, **kwargs):
+    """ Complete uuids and names of cached simulations. """
+    rv = []
+    for c in [
+            cache.shared_cache(cache.LocalSimCache),
+            cache.shared_cache(cache.RemoteSimCache)
+    ]:
+        rv += c.complete(prefix)
+    return rv
+
+
 def print_table(info_list):
     """ Print a formatted table of the given info dict objects.
 
@@ -119,12 +191,93 @@ def ensure_list(x):
     return x
 
 
-def exists_remote(sim):
-    """ Verify that the simulation exists on the remote host. """
-    if sim["host"] == "localhost":
-        return os.path.isdir(sim["path"])
-    ans = search_net(sim, action="verify", update=True)
-    return len(ans) > 0
+def remove_missing(sims):
+    """ Check that simulations exist and remove the missing ones from the caches.
+
+    The paths are checked with one round trip per host
+    and all hosts are checked in parallel.
+
+    Parameters
+    ----------
+    sims : list of dict
+        Simulations to check.
+
+    Returns
+    -------
+    list of dict
+        The simulations which exist or could not be checked
+        because their host was not reachable.
+    """
+    from multiprocessing.pool import ThreadPool
+    by_host = {}
+    for sim in sims:
+        by_host.setdefault(sim["host"], []).append(sim["path"])
+    if len(by_host) == 0:
+        return sims
+    with ThreadPool(len(by_host)) as p:
+        found = p.starmap(existing_paths, by_host.items())
+    existing = dict(zip(by_host, found))
+    rv = []
+    missing = []
+    for sim in sims:
+        paths = existing[sim["host"]]
+        if paths is None or sim["path"] in paths:
+            rv.append(sim)
+        else:
+            missing.append(sim)
+    for cls in [cache.LocalSimCache, cache.RemoteSimCache]:
+        if len(missing) == 0:
+            break
+        c = cache.shared_cache(cls)
+        with c.deferred_save():
+            for sim in missing:
+                if c.contains(sim["uuid"]):
+                    c.remove(sim["uuid"])
+    return rv
+
+
+def existing_paths(host, paths, timeout=None):
+    """ Return the paths which are directories on host.
+
+    Remote hosts are asked in a single ssh call to 'smurf ls --existing'
+    with the paths on stdin, which the restricted smurf ssh key allows.
+
+    Parameters
+    ----------
+    host : str
+        Host as used with ssh or 'localhost'.
+    paths : list of str
+        Paths to check.
+    timeout : float
+        Seconds to wait for the answer of a remote host.
+        Defaults to the config value 'search_timeout'.
+
+    Returns
+    -------
+    set of str
+        The existing paths or None if the host could not be reached.
+    """
+    if host == "localhost":
+        return set(p for p in paths if os.path.isdir(p))
+    import subprocess
+    from smurf.ssh import run_ssh
+    if timeout is None:
+        timeout = smurf.get_config().get("search_timeout")
+    # a shared connection which hangs is not covered by ConnectTimeout
+    options = ["-o", "ConnectTimeout={:d}".format(max(int(timeout), 1))]
+    try:
+        res = run_ssh(host, ["smurf", "ls", "--existing"],
+                      options=options,
+                      input="".join(p + "\n" for p in paths),
+                      stdout=subprocess.PIPE,
+                      stderr=subprocess.PIPE,
+                      universal_newlines=True,
+                      timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return None
+    if res.returncode != 0:
+        return None
+    return set(res.stdout.splitlines())
 
 
 def search_net(patterns=None, host="localhost", update=False, action="search"):
@@ -164,7 +317,8 @@ def search(patterns,
            verbose=False,
            remote=True,
            force_global=False,
-           ensure_exist=False):
+           ensure_exist=False,
+           on_result=None):
     """Search local and remote caches for simulations which match given patterns.
 
     Parameters
@@ -179,15 +333,20 @@ def search(patterns,
         Force querying remote hosts and skip cached results.
     ensure_exist : bool
         Ensure that the result exists on the remote server and initiate new search if not.
+    on_result : callable
+        Gets called with the list of results of each host
+        as soon as it answers a global search.
 
     Returns
     -------
     list of dict
         Simulations that match the search patterns.
+        After a global search, it is a SearchResults list
+        which tells which hosts did not answer.
     """
     patterns = ensure_list(patterns)
 
-    conf = smurf.Config()
+    conf = smurf.get_config()
     if "relay-server" in conf.data:
         rv = search_net(
             patterns=patterns, 
@@ -206,17 +365,13 @@ def search(patterns,
                                   unique=False,
                                   exclusive=exclusive)
     if ensure_exist:
-        to_del = []
-        for n, s in enumerate(rv):
-            if not exists_remote(s):
-                to_del.append(n)
-        for k, m in enumerate(to_del):
-            simid = rv[m-k]["uuid"]
-            cache.RemoteSimCache().remove(simid)
-            del rv[m - k]
+        rv = remove_missing(rv)
     if (len(rv) == 0 and remote) or force_global:
         try:
-            rv = search_global(patterns, verbose=verbose, exclusive=exclusive)
+            rv = search_global(patterns,
+                               verbose=verbose,
+                               exclusive=exclusive,
+                               on_result=on_result)
         except KeyError as e:
             pass
     if len(rv) > 1 and unique:
@@ -228,8 +383,9 @@ def search(patterns,
 
 def search_local_cache(patterns, **kwargs):
     try:
-        c = cache.LocalSimCache()
-        rv = c.search(patterns, **kwargs)
+        c = cache.shared_cache(cache.LocalSimCache)
+        # copy the results so that callers can not alter the shared cache
+        rv = [dict(r) for r in c.search(patterns, **kwargs)]
         for r in rv:
             r["host"] = "localhost"
     except (KeyError, cache.NoSimulationFoundError):
@@ -239,8 +395,8 @@ def search_local_cache(patterns, **kwargs):
 
 def search_remote_cache(patterns, **kwargs):
     try:
-        c = cache.RemoteSimCache()
-        rv = c.search(patterns, **kwargs)
+        c = cache.shared_cache(cache.RemoteSimCache)
+        rv = [dict(r) for r in c.search(patterns, **kwargs)]
     except (KeyError, cache.NoSimulationFoundError):
         return []
     return rv
@@ -258,29 +414,116 @@ def search_remote(args):
     return simulations
 
 
-def search_global(patterns, verbose=False, exclusive=False, remote_cache=None):
+class SearchResults(list):
+    """ Results of a global search and the hosts which did not answer.
+
+    Attributes
+    ----------
+    failed_hosts : dict
+        Maps hosts to the reason why they did not answer.
+    """
+
+    def __init__(self, sims=(), failed_hosts=None):
+        super().__init__(sims)
+        self.failed_hosts = {} if failed_hosts is None else failed_hosts
+
+
+def search_hosts(hosts, search_host, timeout=None, on_result=None):
+    """ Run a search on all hosts in parallel and collect the results.
+
+    Each host is searched in its own daemon thread, so hosts which
+    do not answer in time are given up without blocking the exit.
+
+    Parameters
+    ----------
+    hosts : list of str
+        Hosts to search.
+    search_host : callable
+        Returns the list of results for a host.
+    timeout : float
+        Seconds to wait for the answers. Hosts which did not answer
+        by then are listed as failed. None waits forever.
+    on_result : callable
+        Gets called with the results of each host as soon as they arrive.
+
+    Returns
+    -------
+    SearchResults
+    """
+    import queue
+    import threading
+    import time
+    answers = queue.Queue()
+
+    def worker(host):
+        try:
+            answers.put((host, search_host(host), None))
+        except Exception as e:
+            answers.put((host, None, "{}: {}".format(type(e).__name__, e)))
+
+    for host in hosts:
+        threading.Thread(target=worker, args=(host, ), daemon=True).start()
+    rv = SearchResults()
+    pending = set(hosts)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while len(pending) > 0:
+        try:
+            remaining = None if deadline is None else max(
+                0, deadline - time.monotonic())
+            host, sims, error = answers.get(timeout=remaining)
+        except queue.Empty:
+            break
+        pending.discard(host)
+        if error is not None:
+            rv.failed_hosts[host] = error
+            continue
+        rv += sims
+        if on_result is not None and len(sims) > 0:
+            on_result(sims)
+    for host in pending:
+        rv.failed_hosts[host] = "no answer within {} s".format(timeout)
+    return rv
+
+
+def search_global(patterns,
+                  verbose=False,
+                  exclusive=False,
+                  remote_cache=None,
+                  timeout=None,
+                  on_result=None):
+    """ Search all known hosts and add the results to the remote cache.
+
+    Parameters
+    ----------
+    timeout : float
+        Seconds to wait for the hosts to answer.
+        Defaults to the config value 'search_timeout'.
+    on_result : callable
+        Gets called with the results of each host as soon as they arrive.
+
+    Returns
+    -------
+    SearchResults
+        Results of the hosts which answered in time.
+    """
     from smurfnet.config import Config as NetConfig
     conf = NetConfig()
     hosts = [key for key in conf["hosts"]]
-    args = [[h, patterns, verbose, exclusive] for h in hosts]
-    try:
-        from multiprocessing.pool import ThreadPool as Pool
-        with Pool() as p:
-            res = p.map(search_remote, args)
-    except ImportError:
-        res = []
-        for arg in args:
-            res.append(search_remote(arg))
-    rv = []
-    for host, r in zip(hosts, res):
-        if len(res) > 0:
-            rv += r
+    if timeout is None:
+        timeout = smurf.get_config().get("search_timeout")
+    rv = search_hosts(
+        hosts,
+        lambda host: search_remote([host, patterns, verbose, exclusive]),
+        timeout=timeout,
+        on_result=on_result)
     # add results to remote cache
-    c = cache.RemoteSimCache() if remote_cache is None else remote_cache
-    for sim in rv:
-        c.add_sim_to_cache(sim)
+    c = cache.shared_cache(
+        cache.RemoteSimCache) if remote_cache is None else remote_cache
+    with c.deferred_save():
+        for sim in rv:
+            c.add_sim_to_cache(sim)
     if len(rv) == 0:
-        rv = search_local_cache(patterns)
+        rv = SearchResults(search_local_cache(patterns), rv.failed_hosts)
     return rv
 
 
@@ -0,0 +1,95 @@
+""" Shared ssh connections to remote hosts.
+
+The first connection to a host starts an OpenSSH master connection
+with a control socket in ~/.smurf/ssh. Later ssh and sshfs calls
+to the same host reuse it and skip the handshake.
+The master exits after it was idle for 'ssh_persist' seconds.
+"""
+import os
+from subprocess import run, DEVNULL
+
+import smurf
+import smurf.config
+
+
+def control_dir():
+    """ Directory of the control sockets, created if needed. """
+    d = os.path.join(smurf.config.home_path, "ssh")
+    os.makedirs(d, mode=0o700, exist_ok=True)
+    return d
+
+
+def ssh_options(master="auto"):
+    """ Options which make ssh share one connection per host.
+
+    Parameters
+    ----------
+    master : str
+        Value of the ControlMaster option.
+        'auto' starts a master if there is none, 'no' only reuses one.
+
+    Returns
+    -------
+    list of str
+    """
+    persist = smurf.get_config().get("ssh_persist")
+    return [
+        "-o", "ControlMaster=" + master,
+        "-o", "ControlPath=" + os.path.join(control_dir(), "%C"),
+        "-o", "ControlPersist={:d}".format(persist)
+    ]
+
+
+def ssh_command(host, command=None, options=None):
+    """ Return the arguments to run a command on host over a shared connection.
+
+    Parameters
+    ----------
+    host : str
+        Host as used with ssh, e.g. 'user@host'.
+    command : list of str
+        Command to run remotely, none for a login shell.
+    options : list of str
+        Additional options to ssh.
+    """
+    rv = ["ssh"] + ssh_options() + ([] if options is None else options)
+    rv += ["--", host]
+    if command is not None:
+        rv += command
+    return rv
+
+
+def run_ssh(host, command, options=None, **kwargs):
+    """ Run a command on host using subprocess.run and a shared connection. """
+    return run(ssh_command(host, command, options), **kwargs)
+
+
+def ensure_master(host):
+    """ Start a master connection to host unless one is running.
+
+    Returns
+    -------
+    bool
+        True if a master connection is available.
+    """
+    opts = ssh_options(master="no")
+    check = run(["ssh"] + opts + ["-O", "check", "--", host],
+                stdin=DEVNULL,
+                stdout=DEVNULL,
+                stderr=DEVNULL)
+    if check.returncode == 0:
+        return True
+    # -f puts the master in the background once it is connected,
+    # no file descriptors are inherited to not block the caller's pipes
+    start = run(["ssh"] + ssh_options(master="yes") + ["-f", "-N", "--", host],
+                stdin=DEVNULL,
+                stdout=DEVNULL,
+                stderr=DEVNULL)
+    return start.returncode == 0
+
+
+def host_of(remote):
+    """ Return the host part of a 'host:path' remote location or None. """
+    if ":" not in remote:
+        return None
+    return remote.split(":")[0]
@@ -0,0 +1,51 @@
+""" Setup shared by tests which need a smurf home dir or stub programs. """
+import os
+import stat
+import tempfile
+import unittest
+
+import smurf.config
+
+
+def install_stub(tmpdir, script, name="ssh"):
+    """ Put an executable script into tmpdir/bin and return that dir. """
+    bindir = os.path.join(tmpdir, "bin")
+    os.makedirs(bindir, exist_ok=True)
+    stub = os.path.join(bindir, name)
+    with open(stub, "w") as outfile:
+        outfile.write(script)
+    os.chmod(stub, os.stat(stub).st_mode | stat.S_IEXEC)
+    return bindir
+
+
+class TempHomeTestCase(unittest.TestCase):
+    """ Test case with the smurf home dir in a temp dir.
+
+    Stub programs installed with install_stub are found first on PATH.
+    The home dir and PATH are restored after each test.
+    """
+    # home dir relative to the temp dir, None uses the temp dir itself
+    home_subdir = None
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.old_home = smurf.config.home_path
+        self.old_path = os.environ["PATH"]
+        if self.home_subdir is None:
+            smurf.config.home_path = self.tmpdir.name
+        else:
+            smurf.config.home_path = os.path.join(self.tmpdir.name,
+                                                  self.home_subdir)
+            os.makedirs(smurf.config.home_path)
+
+    def tearDown(self):
+        smurf.config.home_path = self.old_home
+        os.environ["PATH"] = self.old_path
+        self.tmpdir.cleanup()
+
+    def install_stub(self, script, name="ssh"):
+        """ Install a stub program and put its dir on PATH. """
+        bindir = install_stub(self.tmpdir.name, script, name=name)
+        if os.environ["PATH"].split(os.pathsep)[0] != bindir:
+            os.environ["PATH"] = bindir + os.pathsep + os.environ["PATH"]
+        return bindir
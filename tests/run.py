@@ -14,6 +14,14 @@ sys.path = sys.path[:1] + [os.path.join(repo_abspath(),"src")] + sys.path[1:]
 
 # import unit test cases
 from test_import import *
+from test_cache import *
+from test_scan import *
+from test_info import *
+from test_search import *
+from test_ssh import *
+from test_daemon import *
+from test_startup import *
+from test_mount import *
 
 def main():
     unittest.main()
@@ -0,0 +1,482 @@
+import io
+import os
+import sys
+import json
+import uuid
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from multiprocessing import Process
+
+import smurf.config
+from smurf.cache import SimCache, SqliteSimCache, CacheMiss, ResultNotUniqueError
+from smurf.cache import NoSimulationFoundError
+import smurf.cache as cache
+from smurf import bincache
+from base import TempHomeTestCase
+
+
+def make_sim(name):
+    simid = str(uuid.uuid4())
+    return simid, {
+        "uuid": simid,
+        "name": name,
+        "path": "/sims/" + name,
+        "host": "localhost",
+        "tags": "alpha, beta",
+        "simcode": "fargo"
+    }
+
+
+class TestJsonCacheBatching(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmpdir.name, "cache.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def saved_keys(self):
+        try:
+            with open(self.cache_file) as infile:
+                return set(json.load(infile))
+        except FileNotFoundError:
+            return set()
+
+    def test_deferred_save_writes_once(self):
+        c = SimCache(self.cache_file)
+        with c.deferred_save():
+            for n in range(10):
+                c.insert(*make_sim("sim{}".format(n)))
+            self.assertEqual(self.saved_keys(), set())
+        self.assertEqual(self.saved_keys(), set(c.data))
+        self.assertEqual(len(c.data), 10)
+
+    def test_flush_threshold(self):
+        c = SimCache(self.cache_file)
+        with c.deferred_save(flush_threshold=3):
+            for n in range(4):
+                c.insert(*make_sim("sim{}".format(n)))
+            self.assertEqual(len(self.saved_keys()), 3)
+        self.assertEqual(len(self.saved_keys()), 4)
+
+    def test_insert_without_batch_saves(self):
+        c = SimCache(self.cache_file)
+        simid, sim = make_sim("single")
+        c.insert(simid, sim)
+        self.assertEqual(self.saved_keys(), {simid})
+        c.remove(simid.split("-")[0])
+        self.assertEqual(self.saved_keys(), set())
+
+    def test_concurrent_writers(self):
+        def notify(n):
+            c = SimCache(self.cache_file)
+            for k in range(10):
+                c.insert(*make_sim("proc{}_{}".format(n, k)))
+
+        procs = [Process(target=notify, args=(n, )) for n in range(8)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        self.assertEqual(len(self.saved_keys()), 80)
+
+    def test_merge_with_changes_on_disk(self):
+        c = SimCache(self.cache_file)
+        first, sim = make_sim("first")
+        c.insert(first, sim)
+        other = SimCache(self.cache_file)
+        second, sim = make_sim("second")
+        other.insert(second, sim)
+        os.utime(self.cache_file, ns=(0, 0))
+        c.remove(first)
+        self.assertEqual(self.saved_keys(), {second})
+        self.assertTrue(c.contains(second))
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmpdir.name, "cache.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_changes_are_appended(self):
+        c = SimCache(self.cache_file, journal_size=10000)
+        first, sim = make_sim("first")
+        c.insert(first, sim)
+        second, sim = make_sim("second")
+        c.insert(second, sim)
+        self.assertFalse(os.path.exists(self.cache_file))
+        c.remove(first)
+        self.assertEqual(set(SimCache(self.cache_file).data), {second})
+
+    def test_compaction(self):
+        c = SimCache(self.cache_file, journal_size=1000)
+        for n in range(10):
+            c.insert(*make_sim("sim{}".format(n)))
+        self.assertTrue(os.path.exists(self.cache_file))
+        if os.path.exists(c.journal_file):
+            self.assertLess(os.path.getsize(c.journal_file), 1000)
+        self.assertEqual(len(SimCache(self.cache_file).data), 10)
+
+    def test_outdated_journal_is_ignored(self):
+        c = SimCache(self.cache_file, journal_size=10000)
+        first, sim = make_sim("first")
+        c.insert(first, sim)
+        with open(c.journal_file) as infile:
+            journal = infile.read()
+        c.remove(first)
+        SimCache(self.cache_file).save()
+        with open(c.journal_file, "w") as outfile:
+            outfile.write(journal)
+        self.assertEqual(SimCache(self.cache_file).data, {})
+
+    def test_concurrent_writers(self):
+        def notify(n):
+            c = SimCache(self.cache_file, journal_size=2000)
+            for k in range(10):
+                c.insert(*make_sim("proc{}_{}".format(n, k)))
+
+        procs = [Process(target=notify, args=(n, )) for n in range(8)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        self.assertEqual(len(SimCache(self.cache_file).data), 80)
+
+
+class TestSimRecord(unittest.TestCase):
+    def test_dict_access(self):
+        simid, sim = make_sim("record")
+        sim["location"] = "scratch"
+        del sim["tags"]
+        r = cache.SimRecord(sim, simid)
+        self.assertEqual(r, sim)
+        self.assertEqual(dict(r), sim)
+        self.assertEqual(r["path"], sim["path"])
+        self.assertEqual(r.get("location"), "scratch")
+        self.assertIsNone(r.get("tags"))
+        self.assertNotIn("tags", r)
+        self.assertRaises(KeyError, r.__getitem__, "tags")
+        self.assertEqual(set(r), set(sim))
+
+    def test_cache_entries(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_file = os.path.join(tmpdir, "cache.json")
+            c = SimCache(cache_file)
+            with c.deferred_save():
+                for name in ["first", "second"]:
+                    c.insert(*make_sim(name))
+            # plain dicts load faster for short lived commands
+            c = SimCache(cache_file)
+            self.assertIs(type(next(iter(c.data.values()))), dict)
+            c = SimCache(cache_file)
+            c.compact = True
+            first, second = c.data.values()
+            self.assertIsInstance(first, cache.SimRecord)
+            self.assertIs(first["host"], second["host"])
+            with open(cache_file) as infile:
+                self.assertEqual(json.load(infile), c.data)
+
+
+class TestPrefixResolution(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmpdir.name, "cache.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def check_engine(self, engine):
+        c = engine(self.cache_file)
+        ids = {}
+        for name in ["alpha1", "alpha10", "other"]:
+            simid, sim = make_sim(name)
+            ids[name] = simid
+            c.insert(simid, sim)
+        c = engine(self.cache_file)
+        self.assertEqual(c.resolve("alpha1"), ids["alpha1"])
+        self.assertEqual(c.resolve("alpha10"), ids["alpha10"])
+        self.assertEqual(c.resolve("othe"), ids["other"])
+        self.assertEqual(c.resolve(ids["other"][:6]), ids["other"])
+        self.assertRaises(ResultNotUniqueError, c.resolve, "alph")
+        self.assertRaises(CacheMiss, c.resolve, "oth")
+        self.assertRaises(CacheMiss, c.resolve, "nothing")
+        self.assertEqual(sorted(c.complete("alpha")), ["alpha1", "alpha10"])
+        self.assertIn(ids["alpha1"], c.complete(ids["alpha1"][:3]))
+        self.assertEqual(c.request(ids["other"][:10])["name"], "other")
+
+    def test_json(self):
+        self.check_engine(SimCache)
+
+    def test_sqlite(self):
+        self.check_engine(SqliteSimCache)
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmpdir.name, "cache.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def check_engine(self, engine):
+        c = engine(self.cache_file)
+        for name in ["run42_alpha0.01", "run4_alpha0.1", "other"]:
+            c.insert(*make_sim(name))
+
+        def names(patterns, **kwargs):
+            return sorted(s["name"] for s in c.search(patterns, **kwargs))
+
+        self.assertEqual(names("run4"), ["run42_alpha0.01", "run4_alpha0.1"])
+        self.assertEqual(names(["run42", "other"]),
+                         ["other", "run42_alpha0.01"])
+        self.assertEqual(names(r"alpha0\.1$"), ["run4_alpha0.1"])
+        self.assertEqual(names("^run4_"), ["run4_alpha0.1"])
+        self.assertEqual(names(["run4", "0.01"], exclusive=True),
+                         ["run42_alpha0.01"])
+        # exclusive patterns have to match in the same field
+        self.assertRaises(NoSimulationFoundError, c.search,
+                          ["other", "fargo"], exclusive=True)
+        # regexes do not match across fields
+        self.assertRaises(NoSimulationFoundError, c.search, r"other\salpha")
+        self.assertEqual(names("other", fields=["name", "missing"]),
+                         ["other"])
+
+    def test_json(self):
+        self.check_engine(SimCache)
+
+    def test_sqlite(self):
+        self.check_engine(SqliteSimCache)
+
+
+class TestCompletionIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmpdir.name, "cache.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def words(self, c):
+        with open(c.completion_file, "r") as infile:
+            return infile.read().splitlines()
+
+    def test_updated_on_save(self):
+        c = SimCache(self.cache_file, journal_size=10000)
+        first, sim = make_sim("first")
+        c.insert(first, sim)
+        second, sim = make_sim("second")
+        c.insert(second, sim)
+        self.assertEqual(c.completion_file,
+                         os.path.join(self.tmpdir.name, "cache.completion"))
+        self.assertEqual(sorted(self.words(c)),
+                         sorted([first[:8], "first", second[:8], "second"]))
+        # removed entries are dropped once the cache file is rewritten
+        c.remove(first)
+        c.journal_size = 0
+        c.save()
+        self.assertEqual(self.words(c), [second[:8], "second"])
+
+    def test_sqlite(self):
+        c = SqliteSimCache(self.cache_file)
+        simid, sim = make_sim("sqlite")
+        c.insert(simid, sim)
+        self.assertEqual(self.words(c), [simid[:8], "sqlite"])
+        # new entries are appended without rewriting the index
+        with open(c.completion_file, "a") as outfile:
+            outfile.write("marker\n")
+        other, sim = make_sim("other")
+        c.insert(other, sim)
+        self.assertEqual(self.words(c),
+                         [simid[:8], "sqlite", "marker", other[:8], "other"])
+        # removals rewrite it
+        c.remove(simid)
+        self.assertEqual(self.words(c), [other[:8], "other"])
+
+
+class TestSqliteSimCache(TempHomeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache_file = os.path.join(self.tmpdir.name, "cache.json")
+
+    def test_request_insert_remove(self):
+        c = SqliteSimCache(self.cache_file)
+        simid, sim = make_sim("sqlite")
+        c.insert(simid, sim)
+        short = simid.split("-")[0]
+        self.assertTrue(c.contains(short))
+        self.assertEqual(c.request(short), sim)
+        self.assertEqual(SqliteSimCache(self.cache_file).request(simid), sim)
+        self.assertEqual(c.find("tags", "beta"), [sim])
+        self.assertEqual(c.search("sqlite", unique=True), sim)
+        c.remove(short)
+        self.assertFalse(c.contains(simid))
+        self.assertRaises(CacheMiss, c.request, simid)
+
+    def test_upgrade_schema(self):
+        c = SqliteSimCache(self.cache_file)
+        simid, sim = make_sim("upgraded")
+        c.insert(simid, sim)
+        # turn it into a database of a version without token index
+        c.db.execute("DELETE FROM tokens")
+        c.db.execute("DELETE FROM vocabulary")
+        c.db.execute("PRAGMA user_version = 0")
+        c.db.commit()
+        c = SqliteSimCache(self.cache_file)
+        version = c.db.execute("PRAGMA user_version").fetchone()[0]
+        self.assertEqual(version, cache.sqlite_schema_version)
+        tokens = set(r[0] for r in c.db.execute(
+            "SELECT token FROM tokens WHERE uuid = ?", (simid, )))
+        self.assertEqual(tokens, {"upgraded", "alpha", "beta", "fargo",
+                                  "localhost"})
+        self.assertEqual(c.token_search(["grade"], ["name"]), {simid})
+
+    def test_remove_drops_tokens(self):
+        c = SqliteSimCache(self.cache_file)
+        simid, sim = make_sim("removed")
+        c.insert(simid, sim)
+        other, sim = make_sim("kept")
+        c.insert(other, sim)
+        c.remove(simid)
+        count = c.db.execute("SELECT COUNT(*) FROM tokens WHERE uuid = ?",
+                             (simid, )).fetchone()[0]
+        self.assertEqual(count, 0)
+        # words still used by another simulation stay in the vocabulary
+        words = set(t for t, in c.db.execute("SELECT token FROM vocabulary"))
+        self.assertEqual(words, {"kept", "alpha", "beta", "fargo", "localhost"})
+        self.assertRaises(NoSimulationFoundError, c.search, "removed")
+        self.assertEqual(c.token_search(["alph"], ["tags"]), {other})
+
+    def test_fields_outside_token_index(self):
+        c = SqliteSimCache(self.cache_file)
+        simid, sim = make_sim("inpath")
+        c.insert(simid, sim)
+        other, sim = make_sim("other")
+        sim["name"] = "inpath"
+        c.insert(other, sim)
+        # path and uuid are searched in the stored json text
+        self.assertEqual(c.token_search(["inpath"], ["path"]), {simid})
+        self.assertEqual(
+            c.search(simid.split("-")[0], fields=["uuid"], unique=True)["uuid"],
+            simid)
+        self.assertEqual(c.token_search(["inpath"], ["name", "path"]),
+                         {simid, other})
+        # all patterns have to be found in the same field
+        self.assertEqual(
+            c.token_search(["sims", "inpath"], ["name", "path"],
+                           exclusive=True), {simid})
+
+    def test_engine_selected_by_config(self):
+        conf = smurf.config.Config()
+        conf["cache_engine"] = "sqlite"
+        conf.save()
+        c = cache.LocalSimCache()
+        self.assertIsInstance(c, cache.SqliteLocalSimCache)
+        self.assertIsInstance(c, cache.LocalSimCache)
+
+
+class TestBinaryCache(TempHomeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache_file = os.path.join(self.tmpdir.name, "cache.json")
+
+    def test_roundtrip(self):
+        data = dict(make_sim(name) for name in ["a", "b", "c"])
+        keys = list(data)
+        data[keys[0]]["location"] = "héllo"
+        del data[keys[1]]["tags"]
+        data[keys[1]]["uuid"] = "other"
+        data[keys[2]]["host"] = None
+        with open(self.cache_file, "wb") as outfile:
+            outfile.write(bincache.dumps(data))
+        with open(self.cache_file, "rb") as infile:
+            table = bincache.BinaryTable(infile)
+        self.assertEqual(table.to_dict(), data)
+        self.assertEqual(table.get(keys[0]), data[keys[0]])
+        self.assertEqual(table.prefix(keys[1][:6]), [keys[1]])
+        self.assertIsNone(table.get(str(uuid.uuid4())))
+        table.close()
+
+    def test_lookup_without_loading(self):
+        c = cache.BinarySimCache(self.cache_file)
+        self.assertTrue(c.cache_file.endswith(".bin"))
+        with c.deferred_save():
+            for n in range(10):
+                c.insert(*make_sim("sim{}".format(n)))
+        simid, sim = make_sim("journaled")
+        c = cache.BinarySimCache(self.cache_file, journal_size=10000)
+        c.insert(simid, sim)
+        c = cache.BinarySimCache(self.cache_file)
+        self.assertEqual(c.request(simid[:8]), sim)
+        self.assertTrue(c.contains(simid))
+        self.assertFalse(c.contains(str(uuid.uuid4())))
+        self.assertIsNone(c._data)
+        self.assertEqual(len(c.data), 11)
+        self.assertEqual(c.search("journaled", unique=True), sim)
+
+    def test_convert(self):
+        c = cache.LocalSimCache()
+        simid, sim = make_sim("converted")
+        c.insert(simid, sim)
+        self.assertEqual(cache.convert_cache(cache.LocalSimCache, "binary"), 1)
+        c = cache.BinaryLocalSimCache()
+        self.assertEqual(c.request(simid), sim)
+
+    def test_uuid_without_dashes(self):
+        simid, sim = make_sim("hex")
+        c = cache.LocalSimCache()
+        c.insert(uuid.UUID(simid).hex, sim)
+        self.assertEqual(list(c.data), [simid])
+        self.assertEqual(cache.convert_cache(cache.LocalSimCache, "binary"), 1)
+        c = cache.BinarySimCache(self.cache_file, journal_size=10000)
+        other, sim = make_sim("other")
+        c.insert(uuid.UUID(other).hex, sim)
+        # merging the journal into the binary file
+        c.journal_size = None
+        c.save()
+        c = cache.BinarySimCache(self.cache_file)
+        self.assertEqual(c.request(other[:8]), sim)
+
+
+class TestSharedCache(TempHomeTestCase):
+    def test_reload_on_change(self):
+        conf = smurf.config.get_config()
+        self.assertIs(conf, smurf.config.get_config())
+        c = cache.shared_cache(cache.RemoteSimCache)
+        self.assertIs(c, cache.shared_cache(cache.RemoteSimCache))
+        self.assertEqual(c.data, {})
+        simid, sim = make_sim("shared")
+        other = cache.RemoteSimCache()
+        other.insert(simid, sim)
+        # make sure the modification time differs on coarse filesystems
+        os.utime(other.journal_file, ns=(0, 0))
+        self.assertTrue(c.is_stale())
+        c = cache.shared_cache(cache.RemoteSimCache)
+        self.assertEqual(c.request(simid), sim)
+        self.assertFalse(c.is_stale())
+
+    def test_remove_ambiguous_prefix(self):
+        c = cache.LocalSimCache()
+        for name in ["first", "second"]:
+            simid, sim = make_sim(name)
+            simid = "abcd" + simid[4:]
+            c.insert(simid, dict(sim, uuid=simid))
+        err = io.StringIO()
+        old_argv = sys.argv
+        sys.argv = ["cache.py", "-r", "abcd"]
+        try:
+            with redirect_stderr(err), self.assertRaises(SystemExit) as cm:
+                cache.main()
+        finally:
+            sys.argv = old_argv
+        self.assertEqual(cm.exception.code, 1)
+        self.assertIn("ambiguous", err.getvalue())
+        self.assertEqual(len(cache.LocalSimCache().data), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import socket
+import time
+import types
+import threading
+import unittest
+
+import smurf.config
+import smurf.cache as cache
+from smurf import daemon
+from test_cache import make_sim
+from base import TempHomeTestCase
+
+
+def fake_main():
+    if "slow" in sys.argv:
+        time.sleep(2)
+    if "resolve" in sys.argv:
+        print(daemon.resolve_local(sys.argv[-1]))
+        return
+    print(os.getcwd(), " ".join(sys.argv[1:]))
+    print("warning", file=sys.stderr)
+    sys.exit(3)
+
+
+class TestDaemon(TempHomeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.old_compact = cache.SimCache.compact
+        self.simid, sim = make_sim("hot")
+        cache.RemoteSimCache().insert(self.simid, sim)
+        sys.modules["smurf.fakecmd"] = types.SimpleNamespace(main=fake_main)
+        self.path = os.path.join(self.tmpdir.name, "test.sock")
+        self.server = threading.Thread(target=daemon.serve,
+                                       args=(self.path, ["fakecmd"]))
+        self.server.start()
+        for n in range(100):
+            if daemon.query({"ping": True}, path=self.path) is not None:
+                break
+            self.server.join(0.05)
+
+    def tearDown(self):
+        daemon.query({"shutdown": True}, path=self.path)
+        self.server.join()
+        del sys.modules["smurf.fakecmd"]
+        cache.SimCache.compact = self.old_compact
+        super().tearDown()
+
+    def test_run_command(self):
+        answers = list(
+            daemon.send_request({
+                "argv": ["fakecmd", "-p", "location"],
+                "cwd": self.tmpdir.name
+            }, path=self.path))
+        self.assertEqual(answers, [{
+            "stdout": self.tmpdir.name + " -p location\n"
+        }, {
+            "stderr": "warning\n"
+        }, {
+            "code": 3
+        }])
+        rv = daemon.query({"argv": ["ls"], "cwd": "/"}, path=self.path)
+        self.assertEqual(rv["code"], 1)
+
+    def test_failing_requests(self):
+        rv = daemon.query({"argv": ["fakecmd"], "cwd": "/nonexistent"},
+                          path=self.path)
+        self.assertEqual(rv["code"], 1)
+        rv = daemon.query({"argv": []}, path=self.path)
+        self.assertEqual(rv["code"], 1)
+        with daemon.connect(self.path) as conn:
+            conn.sendall(b"not json")
+            conn.shutdown(socket.SHUT_WR)
+            self.assertEqual(json.loads(daemon.receive_all(conn))["code"], 1)
+        self.assertIsNotNone(daemon.query({"ping": True}, path=self.path))
+
+    def test_concurrent_commands(self):
+        slow = threading.Thread(target=daemon.query,
+                                args=({
+                                    "argv": ["fakecmd", "slow"],
+                                    "cwd": "/"
+                                }, ),
+                                kwargs={"path": self.path})
+        slow.start()
+        start = time.monotonic()
+        rv = daemon.query({"argv": ["fakecmd"], "cwd": "/"}, path=self.path)
+        self.assertEqual(rv["code"], 3)
+        self.assertLess(time.monotonic() - start, 1.5)
+        slow.join()
+
+    def test_silent_client(self):
+        old_timeout = daemon.request_timeout
+        daemon.request_timeout = 0.2
+        try:
+            with daemon.connect(self.path):
+                # connected but never sends its request
+                start = time.monotonic()
+                self.assertIsNotNone(
+                    daemon.query({"ping": True}, path=self.path))
+                self.assertLess(time.monotonic() - start, 2)
+        finally:
+            daemon.request_timeout = old_timeout
+
+    def test_hanging_daemon(self):
+        path = os.path.join(self.tmpdir.name, "hang.sock")
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen()
+        old_timeout = daemon.client_timeout
+        daemon.client_timeout = 0.2
+        try:
+            # the command runs without the daemon instead
+            self.assertIsNone(daemon.run_in_daemon("search", [], path=path))
+        finally:
+            daemon.client_timeout = old_timeout
+            server.close()
+
+    def test_compact_entries(self):
+        c = cache.shared_cache(cache.RemoteSimCache)
+        self.assertIsInstance(c.data[self.simid], cache.SimRecord)
+
+    def test_sqlite_engine(self):
+        conf = smurf.config.get_config()
+        conf["cache_engine"] = "sqlite"
+        conf.save()
+        # the config object is shared with the daemon thread and changed in place
+        cache.shared_caches.clear()
+        simid, sim = make_sim("indb")
+        cache.RemoteSimCache().insert(simid, sim)
+        for n in range(2):
+            answers = list(
+                daemon.send_request(
+                    {
+                        "argv": ["fakecmd", "resolve", "indb"],
+                        "cwd": "/"
+                    },
+                    path=self.path))
+            self.assertEqual(answers, [{"stdout": simid + "\n"}, {"code": 0}])
+        # the sqlite cache is not loaded into memory by the daemon
+        c = cache.shared_caches[cache.RemoteSimCache]
+        self.assertIsInstance(c, cache.SqliteSimCache)
+        self.assertEqual(c._search_indices, {})
+
+    def test_resolve(self):
+        rv = daemon.query({"resolve": "hot"}, path=self.path)
+        self.assertEqual(rv, {"code": 0, "uuid": self.simid})
+        # changes to the cache files are picked up
+        simid, sim = make_sim("new")
+        other = cache.RemoteSimCache()
+        other.insert(simid, sim)
+        os.utime(other.journal_file, ns=(0, 0))
+        rv = daemon.query({"resolve": "new"}, path=self.path)
+        self.assertEqual(rv["uuid"], simid)
+        rv = daemon.query({"resolve": "missing"}, path=self.path)
+        self.assertEqual(rv["error"], "CacheMiss")
+
+    def test_fallback(self):
+        # no daemon listens on the default socket
+        self.assertIsNone(daemon.run_in_daemon("search", []))
+        self.assertEqual(daemon.resolve(self.simid[:8]), self.simid)
+        with self.assertRaises(cache.CacheMiss):
+            daemon.resolve("missing")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import io
+import uuid
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from smurf.info import Info
+from smurf.new_uuid import new_uuid
+
+
+def make_simdir(path, meta_dir="meta"):
+    meta = os.path.join(path, meta_dir)
+    os.makedirs(os.path.join(meta, "uuid"))
+    simid = str(uuid.uuid4())
+    with open(os.path.join(meta, "uuid", simid), "w"):
+        pass
+    for name, content in [("name.txt", "mysim"), ("tags.txt", "a\nb"),
+                          ("simcode.txt", "fargo"), ("note.txt", "a note")]:
+        with open(os.path.join(meta, name), "w") as outfile:
+            print(content, file=outfile)
+    return simid
+
+
+class TestInfo(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.simdir = os.path.join(self.tmpdir.name, "sim")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def save(self, info):
+        with redirect_stdout(io.StringIO()):
+            info.save()
+
+    def assertFields(self, info, tags=["a", "b"]):
+        self.assertEqual(info.name, "mysim")
+        self.assertEqual(info.tags, tags)
+        self.assertEqual(info.simcode, "fargo")
+        self.assertEqual(info.note, "a note")
+
+    def test_new_uuid(self):
+        simid = make_simdir(self.simdir)
+        with redirect_stdout(io.StringIO()):
+            new_uuid(self.simdir)
+        info = Info(self.simdir)
+        self.assertNotEqual(info.uuid, simid)
+        self.assertFields(info)
+
+    def test_append_tag(self):
+        simid = make_simdir(self.simdir)
+        info = Info(self.simdir)
+        info.tags.append("c")
+        self.save(info)
+        info = Info(self.simdir)
+        self.assertEqual(info.uuid, simid)
+        self.assertFields(info, tags=["a", "b", "c"])
+
+    def test_job_meta_dir(self):
+        simid = make_simdir(self.simdir, meta_dir="job")
+        self.save(Info(self.simdir))
+        self.assertTrue(os.path.isdir(os.path.join(self.simdir, "meta")))
+        info = Info(self.simdir)
+        self.assertEqual(info.meta_dir, os.path.join(self.simdir, "meta"))
+        self.assertEqual(info.uuid, simid)
+        self.assertFields(info)
+
+
+if __name__ == '__main__':
+    unittest.main()
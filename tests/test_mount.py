@@ -0,0 +1,260 @@
+import os
+import time
+import tempfile
+import threading
+import unittest
+
+from smurf import mount_manager
+from smurf.datacache import DataCache, Prefetch
+from smurf.mount import (Mount, parse_mountinfo, parse_mount_output,
+                         find_existing_mount, MountRegistry)
+from base import TempHomeTestCase
+
+# stand-in for sshfs and fusermount which log their arguments
+stub_logger = """#!/bin/sh
+printf "%s\\n" "$*" >> "{log}"
+"""
+
+mountinfo = """23 28 0:22 / /proc rw,relatime - proc proc rw
+61 28 0:51 / /tmp/smurf-abc/mnt rw,nosuid shared:7 master:1 - fuse.sshfs host:/sims/a rw,user_id=1000
+62 28 0:52 / /tmp/smurf-def/mnt rw,nosuid - fuse.sshfs host:/sims/with\\040space rw
+"""
+
+
+class TestMountDetection(TempHomeTestCase):
+    def test_parse(self):
+        mounts = parse_mountinfo(mountinfo)
+        self.assertEqual(mounts, [
+            ("proc", "/proc", "proc"),
+            ("host:/sims/a", "/tmp/smurf-abc/mnt", "fuse.sshfs"),
+            ("host:/sims/with space", "/tmp/smurf-def/mnt", "fuse.sshfs"),
+        ])
+        self.assertEqual(
+            parse_mount_output(
+                "host:/sims/a on /tmp/smurf-abc/mnt type fuse.sshfs (ro)\n"
+                "host:/sims/b on /private/tmp/smurf-x/mnt (macfuse, nodev)\n"
+            ), [("host:/sims/a", "/tmp/smurf-abc/mnt", "fuse.sshfs"),
+                ("host:/sims/b", "/private/tmp/smurf-x/mnt", "macfuse")])
+
+    def test_find_existing_mount(self):
+        mounts = parse_mountinfo(mountinfo)
+        # a prefix of a mounted location is not mounted itself
+        self.assertIsNone(find_existing_mount("host:/sims", mounts))
+        # mounts which are not registered yet are found and registered
+        self.assertEqual(str(find_existing_mount("host:/sims/a", mounts)),
+                         "/tmp/smurf-abc/mnt")
+        registry = MountRegistry()
+        self.assertEqual(registry.data, {"host:/sims/a": "/tmp/smurf-abc/mnt"})
+        # entries which are not mounted anymore are dropped
+        registry.add("host:/gone", "/tmp/smurf-gone/mnt")
+        self.assertIsNone(find_existing_mount("host:/gone", mounts))
+        self.assertNotIn("host:/gone", MountRegistry().data)
+
+
+class TestDataCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = DataCache(os.path.join(self.tmpdir.name, "cache"), 250)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, size):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "wb") as outfile:
+            outfile.write(b"x" * size)
+        return path
+
+    def test_fetch(self):
+        source = self.write("a", 100)
+        copy = self.cache.fetch("host", "/sims/a", source)
+        self.assertNotEqual(copy, source)
+        self.assertEqual(self.cache.fetch("host", "/sims/a", source), copy)
+        # another host or a changed file are not the same file
+        self.assertNotEqual(self.cache.fetch("other", "/sims/a", source), copy)
+        self.write("a", 50)
+        changed = self.cache.fetch("host", "/sims/a", source)
+        self.assertNotEqual(changed, copy)
+        with open(changed, "rb") as infile:
+            self.assertEqual(infile.read(), b"x" * 50)
+
+    def test_eviction(self):
+        paths = [self.write(name, 100) for name in "abc"]
+        copies = [self.cache.fetch("host", p, p) for p in paths[:2]]
+        # make the first copy the most recently used one
+        os.utime(copies[1], ns=(0, 0))
+        self.assertEqual(self.cache.fetch("host", paths[0], paths[0]),
+                         copies[0])
+        self.cache.fetch("host", paths[2], paths[2])
+        self.assertTrue(os.path.exists(copies[0]))
+        self.assertFalse(os.path.exists(copies[1]))
+        self.assertEqual(self.cache.size, 200)
+
+    def test_pinned_copies_are_kept(self):
+        paths = [self.write(name, 100) for name in "abcd"]
+        pinned = self.cache.fetch("host", paths[0], paths[0], pin=True)
+        os.utime(pinned, ns=(0, 0))
+        for p in paths[1:]:
+            self.cache.fetch("host", p, p)
+        self.assertTrue(os.path.exists(pinned))
+        self.cache.unpin(pinned)
+        self.cache.fetch("host", paths[0] + "x", paths[0])
+        self.assertFalse(os.path.exists(pinned))
+
+    def test_prefetch_keeps_copies(self):
+        paths = [self.write(name, 100) for name in "abcdef"]
+
+        def fetch(path):
+            return self.cache.fetch("host", path, path, pin=True), 100
+
+        prefetch = Prefetch(fetch, paths, workers=3, progress=False,
+                            release=self.cache.unpin)
+        with prefetch.start():
+            prefetch.wait()
+            # more than the size limit while the prefetch holds the copies
+            self.assertTrue(all(os.path.exists(local)
+                                for local in prefetch.local_paths.values()))
+            self.assertEqual(self.cache.size, 600)
+        self.assertEqual(self.cache.pins, {})
+        self.cache.fetch("host", "/other", paths[0])
+        self.assertLessEqual(self.cache.size, 250)
+
+
+class TestMountManager(TempHomeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sshfs_log = os.path.join(self.tmpdir.name, "sshfs.log")
+        self.unmount_log = os.path.join(self.tmpdir.name, "fusermount.log")
+        self.install_stub("#!/bin/sh\nexit 1\n")
+        self.install_stub(stub_logger.format(log=self.sshfs_log), name="sshfs")
+        for name in ["fusermount", "umount"]:
+            self.install_stub(stub_logger.format(log=self.unmount_log),
+                              name=name)
+        self.server = threading.Thread(target=mount_manager.serve,
+                                       kwargs={"idle_timeout": 0.5})
+        self.server.start()
+        for n in range(100):
+            if mount_manager.query({"ping": True},
+                                   path=mount_manager.socket_path()):
+                break
+            self.server.join(0.05)
+
+    def tearDown(self):
+        mount_manager.query({"shutdown": True},
+                            path=mount_manager.socket_path())
+        self.server.join()
+        super().tearDown()
+
+    def lines(self, log):
+        if not os.path.exists(log):
+            return []
+        with open(log, "r") as infile:
+            return infile.read().splitlines()
+
+    def test_refcount(self):
+        first = Mount("host:/sims/a")
+        second = Mount("host:/sims/a")
+        path = first.get_path()
+        self.assertEqual(second.get_path(), path)
+        self.assertTrue(os.path.isdir(path))
+        self.assertEqual(len(self.lines(self.sshfs_log)), 1)
+        self.assertEqual(MountRegistry().data, {"host:/sims/a": path})
+        first.release()
+        time.sleep(0.6)
+        # still used by the second one
+        self.assertEqual(self.lines(self.unmount_log), [])
+        with second:
+            pass
+        self.assertRaises(RuntimeError, second.get_path)
+        # the manager unmounts and exits once nothing is mounted
+        self.server.join(5)
+        self.assertFalse(self.server.is_alive())
+        self.assertEqual(len(self.lines(self.unmount_log)), 1)
+        self.assertFalse(os.path.exists(os.path.dirname(path)))
+        self.assertEqual(MountRegistry().data, {})
+
+    def test_zero_idle_timeout(self):
+        manager = mount_manager.MountManager(0)
+        self.assertGreater(manager.next_wakeup(), 0)
+        # the manager exits cleanly once nothing is mounted
+        path = os.path.join(self.tmpdir.name, "zero.sock")
+        errors = []
+
+        def serve():
+            try:
+                mount_manager.serve(path, 0)
+            except Exception as e:
+                errors.append(e)
+
+        server = threading.Thread(target=serve)
+        server.start()
+        server.join(5)
+        self.assertFalse(server.is_alive())
+        self.assertEqual(errors, [])
+        self.assertFalse(os.path.exists(path))
+
+    def test_stale_timer(self):
+        manager = mount_manager.MountManager(0.3)
+        mountpoint = os.path.join(self.tmpdir.name, "smurf-x", "mnt")
+        os.makedirs(mountpoint)
+        self.assertIsNone(manager.acquire("host:/sims/b", "a", os.getpid()))
+        manager.acquire("host:/sims/b", "a", os.getpid(), mountpoint)
+        manager.release("host:/sims/b", "a")
+        time.sleep(0.2)
+        manager.acquire("host:/sims/b", "b", os.getpid())
+        manager.release("host:/sims/b", "b")
+        time.sleep(0.15)
+        # the timer of the first release is outdated
+        manager.expire()
+        self.assertIn("host:/sims/b", manager.mounts)
+        time.sleep(0.2)
+        manager.expire()
+        self.assertEqual(manager.mounts, {})
+        self.assertFalse(os.path.exists(mountpoint))
+
+    def test_failed_mount(self):
+        self.install_stub("#!/bin/sh\nexit 1\n", name="sshfs")
+        self.assertRaises(OSError, Mount, "host:/sims/a")
+        rv = mount_manager.query({"list": True},
+                                 path=mount_manager.socket_path())
+        self.assertEqual(rv["mounts"], {})
+        self.assertEqual(MountRegistry().data, {})
+
+    def test_local_path(self):
+        with Mount("host:/sims/a") as m:
+            # the stub sshfs leaves a plain directory standing in for the mount
+            with open(os.path.join(m.get_path(), "data.txt"), "w") as outfile:
+                outfile.write("remote data")
+            copy = m.local_path("data.txt")
+            self.assertTrue(copy.startswith(
+                os.path.join(self.tmpdir.name, "data_cache")))
+            with m.open("data.txt") as infile:
+                self.assertEqual(infile.read(), "remote data")
+            self.assertRaises(ValueError, m.open, "data.txt", "w")
+
+    def test_prefetch(self):
+        with Mount("host:/sims/a") as m:
+            os.makedirs(os.path.join(m.get_path(), "out", "snap1"))
+            names = ["a.dat", "out/b.dat", "out/snap1/c.dat"]
+            for name in names + ["notes.txt"]:
+                with open(os.path.join(m.get_path(), name), "w") as outfile:
+                    outfile.write("x" * 100)
+            prefetch = m.prefetch(["*.dat", "out/**/*.dat"],
+                                  workers=4,
+                                  background=True,
+                                  progress=False)
+            fetched = dict(prefetch)
+            self.assertTrue(prefetch.wait(5))
+            self.assertEqual(sorted(fetched), names)
+            self.assertEqual(fetched["a.dat"], m.local_path("a.dat"))
+            self.assertEqual(prefetch.bytes, 300)
+            # copies in the cache are not transferred again
+            calls = []
+            prefetch = m.prefetch("**/*.dat", progress=calls.append)
+            self.assertEqual(prefetch.done, 3)
+            self.assertEqual(prefetch.bytes, 0)
+            self.assertGreater(len(calls), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import uuid
+import tempfile
+import unittest
+
+from smurf.scan import find_simdirs, find_simdirs_parallel
+from smurf.info import get_uuid
+
+
+def make_simdir(path):
+    os.makedirs(os.path.join(path, "meta", "uuid"))
+    with open(os.path.join(path, "meta", "uuid", str(uuid.uuid4())), "w"):
+        pass
+
+
+class TestFindSimdirs(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+        make_simdir(os.path.join(self.root, "a", "sim1"))
+        make_simdir(os.path.join(self.root, "b", "sim2"))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_full_walk(self):
+        found = [p for p, _ in find_simdirs(self.root)]
+        self.assertEqual(sorted(found), [
+            os.path.join(self.root, "a", "sim1"),
+            os.path.join(self.root, "b", "sim2")
+        ])
+
+    def test_incremental_walk(self):
+        state = {}
+        list(find_simdirs(self.root, new_state=state))
+        rv = dict(find_simdirs(self.root, state))
+        self.assertFalse(any(rv.values()))
+
+        new_sim = os.path.join(self.root, "a", "sim3")
+        make_simdir(new_sim)
+        rv = dict(find_simdirs(self.root, state))
+        self.assertEqual(len(rv), 3)
+        self.assertEqual([p for p, changed in rv.items() if changed], [new_sim])
+
+    def test_meta_file_edited_in_place(self):
+        state = {}
+        list(find_simdirs(self.root, new_state=state))
+        sim = os.path.join(self.root, "b", "sim2")
+        name_file = os.path.join(sim, "meta", "name.txt")
+        with open(name_file, "w") as outfile:
+            print("renamed", file=outfile)
+        state = {}
+        list(find_simdirs(self.root, new_state=state))
+        # appending keeps the mtime of the meta dir
+        meta_mtime = os.stat(os.path.dirname(name_file)).st_mtime_ns
+        with open(name_file, "a") as outfile:
+            print("again", file=outfile)
+        os.utime(name_file, ns=(meta_mtime + 10**9, meta_mtime + 10**9))
+        self.assertEqual(os.stat(os.path.dirname(name_file)).st_mtime_ns,
+                         meta_mtime)
+        rv = dict(find_simdirs(self.root, state))
+        self.assertEqual([p for p, changed in rv.items() if changed], [sim])
+
+    def test_prune_and_exclude(self):
+        nested = os.path.join(self.root, "a", "sim1", "sub")
+        make_simdir(nested)
+        excluded = os.path.join(self.root, "b", "output", "sim4")
+        make_simdir(excluded)
+        self.assertNotIn(nested, dict(find_simdirs(self.root)))
+        self.assertIn(nested, dict(find_simdirs(self.root, nested=True)))
+        self.assertIn(excluded, dict(find_simdirs(self.root)))
+        self.assertNotIn(excluded,
+                         dict(find_simdirs(self.root, exclude=["output/"])))
+
+    def test_symlinked_meta_dir(self):
+        target = os.path.join(self.root, "meta_storage")
+        make_simdir(target)
+        linked = os.path.join(self.root, "c", "sim5")
+        os.makedirs(linked)
+        os.symlink(os.path.join(target, "meta"), os.path.join(linked, "meta"))
+        state = {}
+        self.assertIn(linked, dict(find_simdirs(self.root, new_state=state)))
+        self.assertIn(linked, dict(find_simdirs(self.root, state)))
+
+    def test_get_uuid_names(self):
+        sim = os.path.join(self.root, "a", "sim1")
+        simid = get_uuid(sim)
+        self.assertEqual(get_uuid(sim, names=["meta", "output"]), simid)
+        # only the listed meta dirs are looked into
+        self.assertRaises(FileNotFoundError, get_uuid, sim, names=["job"])
+
+    def test_parallel_walk(self):
+        for n in range(5):
+            make_simdir(os.path.join(self.root, "c", "d{}".format(n), "sim"))
+        serial_state = {}
+        serial = dict(find_simdirs(self.root, new_state=serial_state))
+        parallel_state = {}
+        parallel = dict(
+            find_simdirs_parallel([self.root], 4, new_state=parallel_state))
+        self.assertEqual(serial, parallel)
+        self.assertEqual(serial_state, parallel_state)
+
+
+if __name__ == '__main__':
+    unittest.main()
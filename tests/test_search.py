@@ -0,0 +1,140 @@
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import unittest
+from contextlib import redirect_stdout
+
+import smurf
+import smurf.cache as cache
+from smurf.search import (search_hosts, ResultPrinter, remove_missing,
+                          existing_paths)
+from base import TempHomeTestCase
+
+# stand-in for ssh which runs the remote command locally
+# like the restricted smurf ssh key does
+loopback_ssh = """#!/bin/sh
+printf "%s\\n" "$*" >> "{log}"
+while [ "$1" != "--" ]; do shift; done
+shift 2
+SSH_ORIGINAL_COMMAND="$*" exec smurf --use-ssh-original-command
+"""
+
+# smurf command line of this source tree
+smurf_command = """#!/bin/sh
+PYTHONPATH="{src}" exec "{python}" -m smurf._command_line_ "$@"
+"""
+
+
+class TestSearchHosts(unittest.TestCase):
+    def test_partial_results(self):
+        def search_host(host):
+            if host == "broken":
+                raise ConnectionError("connection refused")
+            if host == "hung":
+                time.sleep(5)
+            return [{"name": "sim", "host": host}]
+
+        streamed = []
+        start = time.monotonic()
+        rv = search_hosts(["fast", "broken", "hung"],
+                          search_host,
+                          timeout=0.5,
+                          on_result=streamed.append)
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(rv, [{"name": "sim", "host": "fast"}])
+        self.assertEqual(streamed, [rv])
+        self.assertEqual(sorted(rv.failed_hosts), ["broken", "hung"])
+        self.assertIn("connection refused", rv.failed_hosts["broken"])
+
+
+class TestResultPrinter(unittest.TestCase):
+    def test_streamed_json(self):
+        sims = [{"name": "a", "host": "x"}, {"name": "b", "host": "y"}]
+        out = io.StringIO()
+        with redirect_stdout(out):
+            printer = ResultPrinter(json_output=True)
+            printer.print(sims[:1])
+            printer.finish(sims)
+        self.assertEqual(out.getvalue(), json.dumps(sims, indent=4) + "\n")
+        out = io.StringIO()
+        with redirect_stdout(out):
+            ResultPrinter(json_output=True).finish([])
+        self.assertEqual(out.getvalue(), "[]\n")
+
+    def test_json_closed_on_error(self):
+        out = io.StringIO()
+        with redirect_stdout(out), self.assertRaises(ConnectionError):
+            printer = ResultPrinter(json_output=True)
+            try:
+                printer.print([{"name": "a", "host": "x"}])
+                raise ConnectionError
+            finally:
+                printer.close()
+        self.assertEqual(json.loads(out.getvalue()), [{"name": "a", "host": "x"}])
+
+    def test_table_printed_at_once(self):
+        sims = [{
+            "name": "b" * n,
+            "host": host,
+            "uuid": "u",
+            "tags": "",
+            "simcode": "",
+            "path": "/p"
+        } for n, host in [(1, "y"), (12, "x")]]
+        out = io.StringIO()
+        with redirect_stdout(out):
+            printer = ResultPrinter()
+            printer.print(sims[:1])
+        self.assertEqual(out.getvalue(), "")
+        with redirect_stdout(out):
+            printer.finish(sims)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        # sorted by host and aligned
+        self.assertIn("b" * 12, lines[0])
+        self.assertEqual(len(lines[0]), len(lines[1]))
+
+
+class TestRemoveMissing(TempHomeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.log = os.path.join(self.tmpdir.name, "ssh.log")
+        self.install_stub(smurf_command.format(src=os.path.dirname(
+            os.path.dirname(smurf.__file__)),
+                                               python=sys.executable),
+                          name="smurf")
+        self.install_stub(loopback_ssh.format(log=self.log))
+
+    def test_one_call_per_host(self):
+        sims = []
+        for n in range(20):
+            simid = str(uuid.uuid4())
+            path = os.path.join(self.tmpdir.name, "sim {}".format(n))
+            if n % 2 == 0:
+                os.mkdir(path)
+            sims.append({
+                "uuid": simid,
+                "name": "sim{}".format(n),
+                "path": path,
+                "host": "host{}".format(n % 4)
+            })
+        c = cache.shared_cache(cache.RemoteSimCache)
+        with c.deferred_save():
+            for sim in sims:
+                c.insert(sim["uuid"], sim)
+        rv = remove_missing(sims)
+        self.assertEqual(rv, sims[::2])
+        with open(self.log) as infile:
+            self.assertEqual(len(infile.readlines()), 4)
+        c = cache.RemoteSimCache()
+        self.assertEqual(set(c.data), set(sim["uuid"] for sim in rv))
+
+    def test_unreachable_host(self):
+        # stand-in for ssh hanging on a dead shared connection
+        self.install_stub("#!/bin/sh\nexec sleep 30\n")
+        start = time.monotonic()
+        self.assertIsNone(existing_paths("host", [self.tmpdir.name], 0.3))
+        self.assertLess(time.monotonic() - start, 5)
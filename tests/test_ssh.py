@@ -0,0 +1,50 @@
+import os
+import stat
+import subprocess
+
+from smurf import ssh
+from base import TempHomeTestCase
+
+# stand-in for ssh which logs its arguments and keeps track
+# of the master connection with a marker file
+stub_ssh = """#!/bin/sh
+printf "%s\\n" "$*" >> "{log}"
+case "$*" in
+    *"-O check"*) test -f "{master}" ;;
+    *"ControlMaster=yes"*) touch "{master}" ;;
+    *) echo remote output ;;
+esac
+"""
+
+
+class TestSharedConnections(TempHomeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.log = os.path.join(self.tmpdir.name, "ssh.log")
+        self.install_stub(
+            stub_ssh.format(log=self.log,
+                            master=os.path.join(self.tmpdir.name, "master")))
+
+    def calls(self):
+        with open(self.log) as infile:
+            return infile.read().splitlines()
+
+    def test_master_started_once(self):
+        self.assertTrue(ssh.ensure_master("user@cluster"))
+        self.assertTrue(ssh.ensure_master("user@cluster"))
+        starts = [c for c in self.calls() if "ControlMaster=yes" in c]
+        self.assertEqual(len(starts), 1)
+        self.assertIn("-f -N -- user@cluster", starts[0])
+
+    def test_commands_share_the_socket(self):
+        res = ssh.run_ssh("cluster", ["ls", "/data"],
+                          stdout=subprocess.PIPE,
+                          universal_newlines=True)
+        self.assertEqual(res.stdout, "remote output\n")
+        call, = self.calls()
+        control_path = os.path.join(self.tmpdir.name, "ssh", "%C")
+        self.assertIn("ControlPath=" + control_path, call)
+        self.assertIn("ControlPersist=600", call)
+        self.assertTrue(call.endswith("-- cluster ls /data"))
+        mode = os.stat(os.path.dirname(control_path)).st_mode
+        self.assertEqual(stat.S_IMODE(mode), 0o700)
@@ -0,0 +1,77 @@
+import os
+import sys
+import unittest
+import subprocess
+
+import smurf.cache as cache
+import smurf._command_line_ as cli
+from test_cache import make_sim
+from base import TempHomeTestCase
+
+src_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       "src")
+
+# total import time allowed for 'smurf search <uuid>' in microseconds,
+# generous to not fail on loaded machines, 0 disables the check
+import_budget = int(os.environ.get("SMURF_TEST_IMPORT_BUDGET", 500000))
+# modules which are not needed to search the caches
+slow_modules = [
+    "argcomplete", "sqlite3", "subprocess", "socket", "multiprocessing",
+    "uuid", "textwrap"
+]
+
+
+def import_times(args, home):
+    """ Run the smurf command with python -X importtime.
+
+    Returns
+    -------
+    (str, dict)
+        Output of the command and the self time of each imported module.
+    """
+    code = "import sys; sys.argv = ['smurf'] + sys.argv[1:]; " \
+        "from smurf._command_line_ import main; main()"
+    env = dict(os.environ, HOME=home, PYTHONPATH=src_dir)
+    env.pop("_ARGCOMPLETE", None)
+    # measure imports from bytecode files like in an installed package
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", code] + args,
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE,
+                         universal_newlines=True,
+                         env=env)
+    times = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, _, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(self_time)
+    return res.stdout, times
+
+
+class TestStartup(TempHomeTestCase):
+    # the subprocess finds it through HOME
+    home_subdir = ".smurf"
+
+    def test_search_imports(self):
+        simid, sim = make_sim("startup")
+        c = cache.LocalSimCache()
+        c.insert(simid, sim)
+        # the first run writes the bytecode files
+        import_times(["search", "-p", "path", simid], self.tmpdir.name)
+        out, times = import_times(["search", "-p", "path", simid],
+                                  self.tmpdir.name)
+        self.assertEqual(out, sim["path"] + "\n")
+        for name in slow_modules:
+            self.assertNotIn(name, times)
+        if import_budget > 0:
+            self.assertLess(sum(times.values()), import_budget)
+
+    def test_registry(self):
+        self.assertEqual(cli.available_scripts(), cli.find_scripts())
+        self.assertEqual(cli.available_scripts(filenames=True),
+                         cli.find_scripts(filenames=True))
+
+
+if __name__ == '__main__':
+    unittest.main()